@@ -4,7 +4,12 @@ Add more sample documents for comprehensive recommendation testing
 """
 import sqlite3
 import random
-from datetime import datetime, timedelta
+
+# created_at is computed by SQLite from two offset modifiers, e.g. '-28 days', '+5 hours'
+INSERT_DOCUMENT_SQL = """
+    INSERT INTO documents (title, content, source, confidence, created_by_user_id, company_id, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, datetime('now', 'localtime', ?, ?))
+"""
 
 # Sample documents with diverse topics for TechCorp
 techcorp_docs = [
@@ -83,32 +88,34 @@ techcorp_docs = [
 def add_sample_documents():
     """Add comprehensive sample documents to the database"""
     
-    # Connect to database
-    conn = sqlite3.connect('backend/discover.db')
+    # Connect to database in autocommit mode; the transaction is managed
+    # explicitly below so every insert shares a single commit
+    conn = sqlite3.connect('backend/discover.db', isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
     cursor = conn.cursor()
     
     print("📝 Adding sample documents for comprehensive recommendations...")
     
     # Add documents for TechCorp (company_id = 1)
     company_id = 1
-    base_date = datetime.now() - timedelta(days=30)
     
-    for i, doc in enumerate(techcorp_docs):
-        # Spread documents across time for realistic timestamps
-        created_at = base_date + timedelta(days=i*2, hours=random.randint(1, 23))
-        
-        cursor.execute("""
-            INSERT INTO documents (title, content, source, confidence, created_by_user_id, company_id, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
+    # Spread documents across time for realistic timestamps
+    hours = random.choices(range(1, 24), k=len(techcorp_docs))
+    techcorp_rows = [
+        (
             doc["title"],
             doc["content"],
             doc["source"],
             doc["confidence"],
             doc["created_by_user_id"],
             company_id,
-            created_at.isoformat()
-        ))
+            f"{i*2 - 30:+d} days",
+            f"+{hours[i]} hours"
+        )
+        for i, doc in enumerate(techcorp_docs)
+    ]
     
     # Add some documents for other companies too (P&G, etc.)
     pg_docs = [
@@ -129,23 +136,33 @@ def add_sample_documents():
     ]
     
     # Add P&G documents (company_id = 4)
-    for doc in pg_docs:
-        created_at = datetime.now() - timedelta(days=random.randint(1, 20))
-        cursor.execute("""
-            INSERT INTO documents (title, content, source, confidence, created_by_user_id, company_id, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
+    days_ago = random.choices(range(1, 21), k=len(pg_docs))
+    pg_rows = [
+        (
             doc["title"],
             doc["content"],
             doc["source"],
             doc["confidence"],
             doc["created_by_user_id"],
             4,  # P&G company_id
-            created_at.isoformat()
-        ))
+            f"-{days} days",
+            "+0 hours"
+        )
+        for doc, days in zip(pg_docs, days_ago)
+    ]
+    
+    # Take the write lock up front and insert both batches in one transaction
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.executemany(INSERT_DOCUMENT_SQL, techcorp_rows)
+        cursor.executemany(INSERT_DOCUMENT_SQL, pg_rows)
+    except Exception:
+        cursor.execute("ROLLBACK")
+        conn.close()
+        raise
     
     # Commit changes
-    conn.commit()
+    cursor.execute("COMMIT")
     
     # Get final counts
     cursor.execute("SELECT COUNT(*) FROM documents WHERE company_id = 1")
@@ -1,11 +1,16 @@
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
 import os
+import time
 from dotenv import load_dotenv
+from sqlalchemy import event, text
 
 from models.database import engine, Base
 from models import get_db
+from services import CacheService, RecommendationService, SimpleRecommendationService
+from services.llm_service import close_http_client
 from routers import (
     companies_router,
     users_router,
@@ -17,6 +22,69 @@ from routers import (
 # Load environment variables
 load_dotenv()
 
+# SQLite tuning applied to every new pooled connection
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Composite indexes backing the document list/lookup filters; created with
+# IF NOT EXISTS so databases built before they were added pick them up too
+DOCUMENT_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_docs_company_created "
+    "ON documents (company_id, created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_docs_company_user_created "
+    "ON documents (company_id, created_by_user_id, created_at DESC)",
+)
+
+# Covers the per-company query counts and 24h activity filter behind the
+# Excel insights endpoint
+QUERY_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_queries_company_created "
+    "ON queries (company_id, created_at)",
+)
+
+# Back the company-name and user-email checks in the create routes, so two
+# concurrent requests cannot both insert the same name or email
+UNIQUE_INDEXES = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_companies_name ON companies (name)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users (email)",
+)
+
+# /api/status is polled by health probes; reuse the company count briefly
+STATUS_CACHE_TTL_SECONDS = 5.0
+_status_cache = (0.0, 0)  # (monotonic timestamp, company count)
+
+# Bump whenever tables, DOCUMENT_INDEXES, QUERY_INDEXES or UNIQUE_INDEXES change
+# so existing SQLite databases re-run the startup DDL; recorded in PRAGMA user_version
+SCHEMA_VERSION = 3
+
+
+def _is_file_backed_sqlite(url) -> bool:
+    """WAL only applies to on-disk SQLite databases"""
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+if _is_file_backed_sqlite(engine.url):
+    @event.listens_for(engine, "connect")
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def _schema_is_current() -> bool:
+    """True when the SQLite database was already migrated to SCHEMA_VERSION"""
+    if engine.url.get_backend_name() != "sqlite":
+        return False
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA user_version").scalar() == SCHEMA_VERSION
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -25,14 +93,32 @@ async def lifespan(app: FastAPI):
     """
     # Startup: Create database tables
     print("🚀 Starting Discover vNext API...")
-    print("📊 Creating database tables...")
-    Base.metadata.create_all(bind=engine)
-    print("✅ Database tables created successfully!")
+    if _schema_is_current():
+        print(f"✅ Database schema is at version {SCHEMA_VERSION}, skipping table creation")
+    else:
+        print("📊 Creating database tables...")
+        # Run all startup DDL on one connection/transaction
+        with engine.begin() as conn:
+            Base.metadata.create_all(bind=conn)
+            for ddl in DOCUMENT_INDEXES + QUERY_INDEXES + UNIQUE_INDEXES:
+                conn.execute(text(ddl))
+            # Refresh planner statistics so the new indexes get picked up
+            conn.execute(text("ANALYZE"))
+            if engine.url.get_backend_name() == "sqlite":
+                conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        print("✅ Database tables created successfully!")
+    
+    # Shared services, handed to routes through utils.dependencies
+    app.state.cache_service = CacheService()
+    app.state.recommendation_service = RecommendationService(app.state.cache_service)
+    app.state.simple_recommendation_service = SimpleRecommendationService()
     
     yield
     
     # Shutdown
     print("🛑 Shutting down Discover vNext API...")
+    await app.state.cache_service.close()
+    await close_http_client()
 
 
 # Create FastAPI app
@@ -42,20 +128,19 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "http://localhost:3000",  # React development server
-        "http://127.0.0.1:3000",
-        "http://localhost:3001",
-    ],
+    # React development server: localhost:3000/3001 and 127.0.0.1:3000
+    allow_origin_regex=r"^http://(localhost:300[01]|127\.0\.0\.1:3000)$",
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["*"],
+    allow_headers=["Content-Type", "Authorization"],
+    expose_headers=["X-Next-After-Created-At", "X-Next-After-Id"],
 )
 
 # Include routers
@@ -92,9 +177,13 @@ async def health_check():
 async def api_status(db=Depends(get_db)):
     """Detailed API status with database connectivity"""
     try:
-        # Test database connection
-        from models.models import Company
-        company_count = db.query(Company).count()
+        global _status_cache
+        cached_at, company_count = _status_cache
+        if time.monotonic() - cached_at >= STATUS_CACHE_TTL_SECONDS:
+            # Test database connection
+            from models.models import Company
+            company_count = db.query(Company).count()
+            _status_cache = (time.monotonic(), company_count)
         
         return {
             "status": "healthy",
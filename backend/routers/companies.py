@@ -1,37 +1,100 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from sqlalchemy import exists, insert, lambda_stmt, literal, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from models import get_db, Company
+from models import get_db, Company, User
 from schemas import CompanyCreate, CompanyResponse
+from services import CacheService
+from utils import get_cache_service
 
 router = APIRouter(prefix="/companies", tags=["companies"])
 
 
+def _get_company(db: Session, company_id: int) -> Optional[Company]:
+    """Primary-key lookup through a cached lambda statement"""
+    return db.execute(
+        lambda_stmt(lambda: select(Company).where(Company.id == company_id))
+    ).scalar_one_or_none()
+
+
 @router.post("/", response_model=CompanyResponse, status_code=status.HTTP_201_CREATED)
-async def create_company(
+def create_company(
     company: CompanyCreate,
     db: Session = Depends(get_db)
 ):
     """Create a new company"""
-    # Check if company name already exists
-    existing_company = db.query(Company).filter(Company.name == company.name).first()
-    if existing_company:
+    # Insert only if the name is free, returning the new row in the same statement
+    stmt = insert(Company).from_select(
+        ["name"],
+        select(literal(company.name)).where(~exists().where(Company.name == company.name))
+    ).returning(Company)
+    try:
+        db_company = db.execute(stmt).scalar_one_or_none()
+    except IntegrityError:
+        # A concurrent request took the name after the NOT EXISTS check
+        db.rollback()
+        db_company = None
+    if db_company is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Company with this name already exists"
         )
     
-    db_company = Company(name=company.name)
-    db.add(db_company)
+    # Build the response from the RETURNING row before commit expires it
+    response = CompanyResponse.model_validate(db_company)
     db.commit()
-    db.refresh(db_company)
     
-    return db_company
+    return response
+
+
+@router.post("/bulk", response_model=List[CompanyResponse], status_code=status.HTTP_201_CREATED)
+def create_companies(
+    companies: List[CompanyCreate],
+    db: Session = Depends(get_db)
+):
+    """Create several companies in one request; none are created if any name is taken"""
+    names = [company.name for company in companies]
+    if len(set(names)) != len(names):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Company names must be unique"
+        )
+    
+    taken = db.scalars(select(Company.name).where(Company.name.in_(names))).all()
+    if taken:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Companies with these names already exist: {', '.join(taken)}"
+        )
+    
+    if not companies:
+        return []
+    
+    # One multi-row INSERT, returning the new rows
+    try:
+        db_companies = db.scalars(
+            insert(Company).returning(Company),
+            [{"name": name} for name in names]
+        ).all()
+    except IntegrityError:
+        # A concurrent request took one of the names after the check above
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Company with this name already exists"
+        )
+    
+    # Build the responses from the RETURNING rows before commit expires them
+    response = [CompanyResponse.model_validate(company) for company in db_companies]
+    db.commit()
+    
+    return response
 
 
 @router.get("/", response_model=List[CompanyResponse])
-async def get_companies(
+def get_companies(
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(get_db)
@@ -42,12 +105,12 @@ async def get_companies(
 
 
 @router.get("/{company_id}", response_model=CompanyResponse)
-async def get_company(
+def get_company(
     company_id: int,
     db: Session = Depends(get_db)
 ):
     """Get a specific company by ID"""
-    company = db.query(Company).filter(Company.id == company_id).first()
+    company = _get_company(db, company_id)
     if not company:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -57,13 +120,13 @@ async def get_company(
 
 
 @router.put("/{company_id}", response_model=CompanyResponse)
-async def update_company(
+def update_company(
     company_id: int,
     company_update: CompanyCreate,
     db: Session = Depends(get_db)
 ):
     """Update a company"""
-    company = db.query(Company).filter(Company.id == company_id).first()
+    company = _get_company(db, company_id)
     if not company:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -72,8 +135,11 @@ async def update_company(
     
     # Check if new name conflicts with existing company
     if company.name != company_update.name:
-        existing_company = db.query(Company).filter(Company.name == company_update.name).first()
-        if existing_company:
+        name = company_update.name
+        name_taken = db.execute(
+            lambda_stmt(lambda: select(exists().where(Company.name == name)))
+        ).scalar()
+        if name_taken:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Company with this name already exists"
@@ -87,19 +153,25 @@ async def update_company(
 
 
 @router.delete("/{company_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_company(
+def delete_company(
     company_id: int,
+    background_tasks: BackgroundTasks,
+    cache_service: CacheService = Depends(get_cache_service),
     db: Session = Depends(get_db)
 ):
     """Delete a company"""
-    company = db.query(Company).filter(Company.id == company_id).first()
+    company = _get_company(db, company_id)
     if not company:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Company not found"
         )
     
+    user_ids = db.execute(select(User.id).where(User.company_id == company_id)).scalars().all()
     db.delete(company)
     db.commit()
     
+    # The company's users go with it; drop their cached memberships
+    background_tasks.add_task(cache_service.invalidate_company_memberships, company_id, user_ids)
+    
     return None
\ No newline at end of file
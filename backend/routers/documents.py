@@ -1,34 +1,91 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response, status
+from sqlalchemy import String, exists, insert, lambda_stmt, literal, select, tuple_, type_coerce, update
+from sqlalchemy.orm import Session, joinedload, load_only
 from typing import List, Optional
 
 from models import get_db, Document, User
-from schemas import DocumentCreate, DocumentResponse
+from schemas import DocumentCreate, DocumentResponse, DocumentSummaryResponse
+from services import CacheService
+from utils import get_cache_service, user_in_company
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 
+# Upper bound for list page sizes
+MAX_PAGE_SIZE = 500
 
-@router.get("/", response_model=List[DocumentResponse])
-async def get_documents(
+# Columns needed by DocumentSummaryResponse; list endpoints skip the content body
+SUMMARY_COLUMNS = load_only(
+    Document.id,
+    Document.title,
+    Document.source,
+    Document.confidence,
+    Document.created_by_user_id,
+    Document.company_id,
+    Document.created_at
+)
+
+# The response embeds the author and their company; join them into the page
+# query rather than lazy-loading them per row
+AUTHOR_WITH_COMPANY = joinedload(Document.created_by_user).joinedload(User.company)
+
+# created_at exactly as SQLite stores it. Rows hold both CURRENT_TIMESTAMP
+# ("YYYY-MM-DD HH:MM:SS") and SQLAlchemy ("...HH:MM:SS.ffffff") text, so the
+# keyset cursor carries the stored string rather than a re-rendered datetime
+RAW_CREATED_AT = type_coerce(Document.created_at, String)
+
+
+def _paginate(
+    query,
+    response: Response,
+    skip: int,
+    limit: int,
+    after_created_at: Optional[str],
+    after_id: Optional[int]
+) -> List[Document]:
+    """
+    Page a newest-first document query. With an (after_created_at, after_id)
+    cursor the page starts with an index seek instead of skipping rows; the
+    cursor for the following page is returned in X-Next-After-* headers and
+    must be passed back unchanged.
+    """
+    query = query.add_columns(RAW_CREATED_AT).order_by(Document.created_at.desc(), Document.id.desc())
+    
+    if after_created_at is not None and after_id is not None:
+        query = query.filter(
+            tuple_(RAW_CREATED_AT, Document.id) < tuple_(after_created_at, after_id)
+        )
+    else:
+        query = query.offset(skip)
+    
+    rows = query.limit(limit).all()
+    
+    if rows and len(rows) == limit:
+        last, last_created_at = rows[-1]
+        response.headers["X-Next-After-Created-At"] = last_created_at
+        response.headers["X-Next-After-Id"] = str(last.id)
+    
+    return [document for document, _ in rows]
+
+
+@router.get("/", response_model=List[DocumentSummaryResponse])
+def get_documents(
     company_id: int,
+    response: Response,
     user_id: Optional[int] = None,
     skip: int = 0,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    after_created_at: Optional[str] = None,
+    after_id: Optional[int] = None,
     db: Session = Depends(get_db)
 ):
     """
     Get documents for a company, optionally filtered by user
     """
-    query = db.query(Document).filter(Document.company_id == company_id)
+    query = db.query(Document).options(SUMMARY_COLUMNS, AUTHOR_WITH_COMPANY).filter(Document.company_id == company_id)
     
     if user_id:
         # Validate user belongs to company
-        user = db.query(User).filter(
-            User.id == user_id,
-            User.company_id == company_id
-        ).first()
-        
-        if not user:
+        if not user_in_company(db, user_id, company_id):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Invalid user or company"
@@ -36,12 +93,11 @@ async def get_documents(
         
         query = query.filter(Document.created_by_user_id == user_id)
     
-    documents = query.order_by(Document.created_at.desc()).offset(skip).limit(limit).all()
-    return documents
+    return _paginate(query, response, skip, limit, after_created_at, after_id)
 
 
 @router.get("/{document_id}", response_model=DocumentResponse)
-async def get_document(
+def get_document(
     document_id: int,
     company_id: int,
     db: Session = Depends(get_db)
@@ -49,10 +105,12 @@ async def get_document(
     """
     Get a specific document by ID (with company validation)
     """
-    document = db.query(Document).filter(
-        Document.id == document_id,
-        Document.company_id == company_id
-    ).first()
+    document = db.execute(
+        lambda_stmt(lambda: select(Document).where(
+            Document.id == document_id,
+            Document.company_id == company_id
+        ))
+    ).scalar_one_or_none()
     
     if not document:
         raise HTTPException(
@@ -64,102 +122,120 @@ async def get_document(
 
 
 @router.post("/", response_model=DocumentResponse, status_code=status.HTTP_201_CREATED)
-async def create_document(
+def create_document(
     document: DocumentCreate,
     db: Session = Depends(get_db)
 ):
     """
     Create a new document
     """
-    # Validate user belongs to company
-    user = db.query(User).filter(
-        User.id == document.created_by_user_id,
-        User.company_id == document.company_id
-    ).first()
+    # Insert only if the user belongs to the company, returning the new row
+    # in the same statement
+    stmt = insert(Document).from_select(
+        ["title", "content", "source", "confidence", "created_by_user_id", "company_id"],
+        select(
+            literal(document.title),
+            literal(document.content),
+            literal(document.source),
+            literal(document.confidence),
+            literal(document.created_by_user_id),
+            literal(document.company_id)
+        ).where(
+            exists().where(
+                User.id == document.created_by_user_id,
+                User.company_id == document.company_id
+            )
+        )
+    ).returning(Document)
+    db_document = db.execute(stmt).scalar_one_or_none()
     
-    if not user:
+    if db_document is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid user or company"
         )
     
-    db_document = Document(
-        title=document.title,
-        content=document.content,
-        source=document.source,
-        confidence=document.confidence,
-        created_by_user_id=document.created_by_user_id,
-        company_id=document.company_id
-    )
-    
-    db.add(db_document)
+    # Build the response from the RETURNING row before commit expires it
+    response = DocumentResponse.model_validate(db_document)
     db.commit()
-    db.refresh(db_document)
     
-    return db_document
+    return response
 
 
 @router.put("/{document_id}", response_model=DocumentResponse)
-async def update_document(
+def update_document(
     document_id: int,
     document_update: DocumentCreate,
+    background_tasks: BackgroundTasks,
+    cache_service: CacheService = Depends(get_cache_service),
     db: Session = Depends(get_db)
 ):
     """
     Update a document
     """
-    # Get document with company validation
-    document = db.query(Document).filter(
+    # Update with company scoping and author validation in a single statement
+    stmt = update(Document).where(
         Document.id == document_id,
-        Document.company_id == document_update.company_id
-    ).first()
-    
-    if not document:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Document not found"
+        Document.company_id == document_update.company_id,
+        exists().where(
+            User.id == document_update.created_by_user_id,
+            User.company_id == document_update.company_id
         )
+    ).values(
+        title=document_update.title,
+        content=document_update.content,
+        source=document_update.source,
+        confidence=document_update.confidence,
+        created_by_user_id=document_update.created_by_user_id
+    ).returning(Document)
+    document = db.execute(stmt).scalar_one_or_none()
     
-    # Validate user belongs to company
-    user = db.query(User).filter(
-        User.id == document_update.created_by_user_id,
-        User.company_id == document_update.company_id
-    ).first()
-    
-    if not user:
+    if document is None:
+        # Nothing updated: tell a missing document apart from an invalid author
+        document_exists = db.execute(
+            select(exists().where(
+                Document.id == document_id,
+                Document.company_id == document_update.company_id
+            ))
+        ).scalar()
+        if not document_exists:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Document not found"
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid user or company"
         )
     
-    # Update document
-    document.title = document_update.title
-    document.content = document_update.content
-    document.source = document_update.source
-    document.confidence = document_update.confidence
-    document.created_by_user_id = document_update.created_by_user_id
-    
+    response = DocumentResponse.model_validate(document)
     db.commit()
-    db.refresh(document)
     
-    return document
+    # An in-place edit leaves the corpus version unchanged; retire the cached index
+    background_tasks.add_task(cache_service.bump_corpus_generation, document_update.company_id)
+    
+    return response
 
 
 @router.delete("/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_document(
+def delete_document(
     document_id: int,
     company_id: int,
     user_id: int,
+    background_tasks: BackgroundTasks,
+    cache_service: CacheService = Depends(get_cache_service),
     db: Session = Depends(get_db)
 ):
     """
     Delete a document (with security checks)
     """
-    document = db.query(Document).filter(
-        Document.id == document_id,
-        Document.company_id == company_id,
-        Document.created_by_user_id == user_id
-    ).first()
+    document = db.execute(
+        lambda_stmt(lambda: select(Document).where(
+            Document.id == document_id,
+            Document.company_id == company_id,
+            Document.created_by_user_id == user_id
+        ))
+    ).scalar_one_or_none()
     
     if not document:
         raise HTTPException(
@@ -170,35 +246,35 @@ async def delete_document(
     db.delete(document)
     db.commit()
     
+    background_tasks.add_task(cache_service.bump_corpus_generation, company_id)
+    
     return None
 
 
-@router.get("/user/{user_id}", response_model=List[DocumentResponse])
-async def get_user_documents(
+@router.get("/user/{user_id}", response_model=List[DocumentSummaryResponse])
+def get_user_documents(
     user_id: int,
     company_id: int,
+    response: Response,
     skip: int = 0,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    after_created_at: Optional[str] = None,
+    after_id: Optional[int] = None,
     db: Session = Depends(get_db)
 ):
     """
     Get all documents created by a specific user
     """
     # Validate user belongs to company
-    user = db.query(User).filter(
-        User.id == user_id,
-        User.company_id == company_id
-    ).first()
-    
-    if not user:
+    if not user_in_company(db, user_id, company_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid user or company"
         )
     
-    documents = db.query(Document).filter(
+    query = db.query(Document).options(SUMMARY_COLUMNS, AUTHOR_WITH_COMPANY).filter(
         Document.created_by_user_id == user_id,
         Document.company_id == company_id
-    ).order_by(Document.created_at.desc()).offset(skip).limit(limit).all()
+    )
     
-    return documents
\ No newline at end of file
+    return _paginate(query, response, skip, limit, after_created_at, after_id)
\ No newline at end of file
@@ -1,23 +1,170 @@
 """
 Excel Integration Router for Activity Report Processing
 """
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from uuid import uuid4
+import aiofiles
+import hashlib
+import orjson
+import xxhash
 import tempfile
 import os
 
 from models import get_db
-from services.excel_integration_service import ExcelIntegrationService
+from services import CacheService
+from services.excel_integration_service import ExcelIntegrationService, REPORT_SHEETS
+from utils import get_cache_service
 
 router = APIRouter(prefix="/excel", tags=["excel-integration"])
 
-# Initialize service
+# Initialize services
 excel_service = ExcelIntegrationService()
 
+# One worker per report sheet; workers are spawned on first use
+sheet_executor = ProcessPoolExecutor(max_workers=len(REPORT_SHEETS))
+
+# Uploads are copied to disk in chunks of this size so memory stays bounded
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+# Leading bytes of .xlsx (ZIP container) and legacy .xls (OLE2 compound file) workbooks
+EXCEL_SIGNATURES = (b"PK\x03\x04", b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1")
+
+# Largest accepted activity report
+MAX_UPLOAD_BYTES = 100 * (1 << 20)  # 100 MiB
+
+
+def _upload_too_large() -> HTTPException:
+    """413 raised for uploads over MAX_UPLOAD_BYTES"""
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File exceeds the {MAX_UPLOAD_BYTES // (1 << 20)} MB upload limit"
+    )
+
+
+def _check_content_length(request: Request) -> None:
+    """Reject a request whose declared body size is over the limit before spooling it"""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        raise _upload_too_large()
+
+
+async def _spool_upload(file: UploadFile) -> Tuple[str, str]:
+    """
+    Stream an uploaded file to a temporary file.
+    Returns the temp file path and the SHA-256 hex digest of the content,
+    computed on the same pass. The temp file is closed before returning so it
+    can be reopened by the parser. Fails with 400 if the content does not
+    start with an Excel signature and with 413 once it passes MAX_UPLOAD_BYTES.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    temp_file_path = os.path.join(tempfile.gettempdir(), f"{uuid4().hex}.xlsx")
+    try:
+        async with aiofiles.open(temp_file_path, 'wb') as temp_file:
+            first_chunk = True
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                # Reject non-workbooks up front instead of letting the parser fail on them
+                if first_chunk and not chunk.startswith(EXCEL_SIGNATURES):
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="File is not a valid Excel workbook"
+                    )
+                first_chunk = False
+                
+                # Content-Length can be absent or wrong, so enforce the cap on the bytes seen
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise _upload_too_large()
+                digest.update(chunk)
+                await temp_file.write(chunk)
+    except Exception:
+        await _remove_upload(temp_file_path)
+        raise
+    return temp_file_path, digest.hexdigest()
+
+
+async def _remove_upload(temp_file_path: str) -> None:
+    """Delete a spooled upload without blocking the event loop"""
+    try:
+        await run_in_threadpool(os.unlink, temp_file_path)
+    except OSError:
+        pass
+
+
+# The activity report template never changes, so it is serialized once at
+# import time and served as raw bytes with a long-lived cache validator
+FORMAT_TEMPLATE = {
+    "excel_format": {
+        "sheets": {
+            "Companies": {
+                "required_columns": ["name"],
+                "optional_columns": ["industry"],
+                "description": "List of companies in the organization"
+            },
+            "Users": {
+                "required_columns": ["name", "email", "company_name"],
+                "optional_columns": [],
+                "description": "List of users with their company association"
+            },
+            "Queries": {
+                "required_columns": ["user_email", "company_name", "query_text"],
+                "optional_columns": ["timestamp"],
+                "description": "User queries for intent analysis and recommendations"
+            },
+            "Documents": {
+                "required_columns": ["title", "content", "user_email", "company_name"],
+                "optional_columns": ["confidence"],
+                "description": "Documents created by users for recommendation engine"
+            }
+        },
+        "example_data": {
+            "Companies": [
+                {"name": "TechCorp", "industry": "Technology"}
+            ],
+            "Users": [
+                {"name": "Alice Johnson", "email": "alice@techcorp.com", "company_name": "TechCorp"}
+            ],
+            "Queries": [
+                {
+                    "user_email": "alice@techcorp.com", 
+                    "company_name": "TechCorp",
+                    "query_text": "How to implement microservices?",
+                    "timestamp": "2025-08-08 10:30:00"
+                }
+            ],
+            "Documents": [
+                {
+                    "title": "Microservices Guide",
+                    "content": "A comprehensive guide to microservices architecture...",
+                    "user_email": "alice@techcorp.com",
+                    "company_name": "TechCorp",
+                    "confidence": 0.9
+                }
+            ]
+        }
+    },
+    "notes": [
+        "All sheets are optional, but at least Companies and Users are recommended",
+        "Timestamps can be in various formats (Excel will auto-detect)",
+        "Company names must match exactly between sheets",
+        "User emails must match exactly between sheets",
+        "Confidence values should be between 0.0 and 1.0"
+    ]
+}
+FORMAT_TEMPLATE_BYTES = orjson.dumps(FORMAT_TEMPLATE)
+FORMAT_TEMPLATE_HEADERS = {
+    "Cache-Control": "public, max-age=86400",
+    "ETag": f'W/"{xxhash.xxh3_64_hexdigest(FORMAT_TEMPLATE_BYTES)}"'
+}
+
 
 @router.post("/upload-activity-report")
 async def upload_activity_report(
+    request: Request,
     file: UploadFile = File(...),
     db: Session = Depends(get_db)
 ) -> Dict[str, Any]:
@@ -31,6 +178,8 @@ async def upload_activity_report(
     - Documents sheet: title, content, user_email, company_name, confidence (optional)
     """
     
+    _check_content_length(request)
+    
     # Validate file type
     if not file.filename.endswith(('.xlsx', '.xls')):
         raise HTTPException(
@@ -39,26 +188,34 @@ async def upload_activity_report(
         )
     
     try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_file_path = temp_file.name
+        # Save uploaded file temporarily. Unlike validation, the import result
+        # is never reused by content hash: it depends on the database too
+        temp_file_path, _ = await _spool_upload(file)
+        
+        # Parse the workbook once; validation and processing share the sheets
+        try:
+            excel_data = await excel_service.read_workbook(
+                temp_file_path, read_only=True, executor=sheet_executor
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid Excel format: Error reading Excel file: {str(e)}"
+            )
+        finally:
+            # Clean up temp file
+            await _remove_upload(temp_file_path)
         
         # Validate Excel format first
-        validation = excel_service.validate_excel_format(temp_file_path)
+        validation = excel_service.validate_excel_format(excel_data)
         if not validation["valid"]:
-            os.unlink(temp_file_path)  # Clean up temp file
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Invalid Excel format: {validation.get('error', validation.get('errors', []))}"
             )
         
         # Process the Excel file
-        results = await excel_service.process_activity_report(temp_file_path, db)
-        
-        # Clean up temp file
-        os.unlink(temp_file_path)
+        results = await excel_service.process_activity_report(excel_data, db)
         
         if "error" in results:
             raise HTTPException(
@@ -79,10 +236,7 @@ async def upload_activity_report(
     except Exception as e:
         # Clean up temp file if it exists
         if 'temp_file_path' in locals():
-            try:
-                os.unlink(temp_file_path)
-            except:
-                pass
+            await _remove_upload(temp_file_path)
         
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -92,12 +246,16 @@ async def upload_activity_report(
 
 @router.post("/validate-format")
 async def validate_excel_format(
-    file: UploadFile = File(...)
+    request: Request,
+    file: UploadFile = File(...),
+    cache_service: CacheService = Depends(get_cache_service)
 ) -> Dict[str, Any]:
     """
     Validate Excel file format without processing the data.
     """
     
+    _check_content_length(request)
+    
     if not file.filename.endswith(('.xlsx', '.xls')):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -106,29 +264,30 @@ async def validate_excel_format(
     
     try:
         # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_file_path = temp_file.name
+        temp_file_path, content_hash = await _spool_upload(file)
         
-        # Validate format
-        validation = excel_service.validate_excel_format(temp_file_path)
+        # Validate format, reusing the result for previously seen content
+        validation = await cache_service.get_excel_result("validation", content_hash)
+        if validation is None:
+            validation = await run_in_threadpool(
+                excel_service.validate_excel_format, temp_file_path, True
+            )
+            await cache_service.cache_excel_result("validation", content_hash, validation)
         
         # Clean up temp file
-        os.unlink(temp_file_path)
+        await _remove_upload(temp_file_path)
         
         return {
             "filename": file.filename,
             "validation": validation
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         # Clean up temp file if it exists
         if 'temp_file_path' in locals():
-            try:
-                os.unlink(temp_file_path)
-            except:
-                pass
+            await _remove_upload(temp_file_path)
         
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -155,65 +314,15 @@ async def get_real_time_insights(
 
 
 @router.get("/format-template")
-async def get_format_template() -> Dict[str, Any]:
+async def get_format_template(request: Request) -> Response:
     """
     Get the expected Excel format template for activity reports.
     """
-    return {
-        "excel_format": {
-            "sheets": {
-                "Companies": {
-                    "required_columns": ["name"],
-                    "optional_columns": ["industry"],
-                    "description": "List of companies in the organization"
-                },
-                "Users": {
-                    "required_columns": ["name", "email", "company_name"],
-                    "optional_columns": [],
-                    "description": "List of users with their company association"
-                },
-                "Queries": {
-                    "required_columns": ["user_email", "company_name", "query_text"],
-                    "optional_columns": ["timestamp"],
-                    "description": "User queries for intent analysis and recommendations"
-                },
-                "Documents": {
-                    "required_columns": ["title", "content", "user_email", "company_name"],
-                    "optional_columns": ["confidence"],
-                    "description": "Documents created by users for recommendation engine"
-                }
-            },
-            "example_data": {
-                "Companies": [
-                    {"name": "TechCorp", "industry": "Technology"}
-                ],
-                "Users": [
-                    {"name": "Alice Johnson", "email": "alice@techcorp.com", "company_name": "TechCorp"}
-                ],
-                "Queries": [
-                    {
-                        "user_email": "alice@techcorp.com", 
-                        "company_name": "TechCorp",
-                        "query_text": "How to implement microservices?",
-                        "timestamp": "2025-08-08 10:30:00"
-                    }
-                ],
-                "Documents": [
-                    {
-                        "title": "Microservices Guide",
-                        "content": "A comprehensive guide to microservices architecture...",
-                        "user_email": "alice@techcorp.com",
-                        "company_name": "TechCorp",
-                        "confidence": 0.9
-                    }
-                ]
-            }
-        },
-        "notes": [
-            "All sheets are optional, but at least Companies and Users are recommended",
-            "Timestamps can be in various formats (Excel will auto-detect)",
-            "Company names must match exactly between sheets",
-            "User emails must match exactly between sheets",
-            "Confidence values should be between 0.0 and 1.0"
-        ]
-    }
\ No newline at end of file
+    if request.headers.get("if-none-match") == FORMAT_TEMPLATE_HEADERS["ETag"]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=FORMAT_TEMPLATE_HEADERS)
+    
+    return Response(
+        content=FORMAT_TEMPLATE_BYTES,
+        media_type="application/json",
+        headers=FORMAT_TEMPLATE_HEADERS
+    )
@@ -1,16 +1,27 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Dict, List
+from pydantic import TypeAdapter
 
 from models import get_db, User
-from schemas import RecommendationResponse
-from services import RecommendationService, CacheService
+from schemas import BatchRecommendationRequest, RecommendationResponse
+from services import RecommendationService, CacheService, SimpleRecommendationService
+from utils import (
+    get_cache_service,
+    get_recommendation_service,
+    get_simple_recommendation_service,
+    user_in_company_cached
+)
 
 router = APIRouter(prefix="/recommendations", tags=["recommendations"])
 
-# Initialize services
-cache_service = CacheService()
-recommendation_service = RecommendationService(cache_service)
+# Built once; validating the list in bulk avoids per-item constructor calls
+recommendation_list_adapter = TypeAdapter(List[RecommendationResponse])
+
+# Upper bound for users scored in one batch request
+MAX_BATCH_USERS = 100
 
 
 @router.get("/{user_id}", response_model=List[RecommendationResponse])
@@ -18,18 +29,15 @@ async def get_recommendations(
     user_id: int,
     company_id: int,
     limit: int = 10,
+    cache_service: CacheService = Depends(get_cache_service),
+    recommendation_service: RecommendationService = Depends(get_recommendation_service),
     db: Session = Depends(get_db)
 ):
     """
     Get personalized recommendations for a user based on their query history
     """
     # Validate user belongs to company
-    user = db.query(User).filter(
-        User.id == user_id,
-        User.company_id == company_id
-    ).first()
-    
-    if not user:
+    if not await user_in_company_cached(db, cache_service, user_id, company_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid user or company"
@@ -43,21 +51,63 @@ async def get_recommendations(
             limit=limit
         )
         
-        # Convert to response format
-        recommendation_responses = []
-        for rec in recommendations:
-            recommendation_responses.append(RecommendationResponse(
-                id=rec["id"],
-                title=rec["title"],
-                content=rec["content"],
-                source=rec["source"],
-                confidence=rec["confidence"],
-                relevance_score=rec["relevance_score"],
-                explanation=rec["explanation"],
-                created_at=rec["created_at"]
-            ))
+        # Validate the whole list in one pydantic-core call
+        return recommendation_list_adapter.validate_python(recommendations)
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error generating recommendations: {str(e)}"
+        )
+
+
+@router.post("/batch", response_model=Dict[int, List[RecommendationResponse]])
+async def get_recommendations_batch(
+    request: BatchRecommendationRequest,
+    cache_service: CacheService = Depends(get_cache_service),
+    simple_recommendation_service: SimpleRecommendationService = Depends(get_simple_recommendation_service),
+    db: Session = Depends(get_db)
+):
+    """
+    Get recommendations for several users of one company in a single request;
+    every user is scored against the same cached document index
+    """
+    user_ids = list(dict.fromkeys(request.user_ids))
+    if not user_ids or len(user_ids) > MAX_BATCH_USERS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Between 1 and {MAX_BATCH_USERS} user ids are required"
+        )
+    
+    # Validate every user belongs to the company, in one query
+    members = db.query(func.count(User.id)).filter(
+        User.id.in_(user_ids),
+        User.company_id == request.company_id
+    ).scalar()
+    if members != len(user_ids):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid user or company"
+        )
+    
+    try:
+        # Bumped on document edits, so the cached index is refitted after one
+        corpus_generation = await cache_service.get_corpus_generation(request.company_id)
+        
+        # Scoring is CPU-bound; keep it off the event loop
+        recommendations = await run_in_threadpool(
+            simple_recommendation_service.get_recommendations_batch,
+            user_ids,
+            request.company_id,
+            db,
+            request.limit,
+            corpus_generation
+        )
         
-        return recommendation_responses
+        return {
+            user_id: recommendation_list_adapter.validate_python(user_recommendations)
+            for user_id, user_recommendations in recommendations.items()
+        }
         
     except Exception as e:
         raise HTTPException(
@@ -70,18 +120,15 @@ async def get_recommendations(
 async def refresh_recommendations(
     user_id: int,
     company_id: int,
+    cache_service: CacheService = Depends(get_cache_service),
+    recommendation_service: RecommendationService = Depends(get_recommendation_service),
     db: Session = Depends(get_db)
 ):
     """
     Force refresh recommendations for a user (clear cache)
     """
     # Validate user belongs to company
-    user = db.query(User).filter(
-        User.id == user_id,
-        User.company_id == company_id
-    ).first()
-    
-    if not user:
+    if not await user_in_company_cached(db, cache_service, user_id, company_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid user or company"
@@ -112,7 +159,9 @@ async def refresh_recommendations(
 
 
 @router.get("/health/cache")
-async def check_cache_health():
+async def check_cache_health(
+    cache_service: CacheService = Depends(get_cache_service)
+):
     """
     Check if Redis cache is working properly
     """
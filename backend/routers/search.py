@@ -1,46 +1,126 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, joinedload
+from typing import Dict, List, Optional
 
-from models import get_db, User, Company, Document, Query
+from models import get_db, Document, Query, User
+from models.database import engine
 from schemas import SearchRequest, SearchResponse, QueryResponse
-from services import LLMService, CacheService, RecommendationService
+from services import LLMService, CacheService
+from services.llm_service import ANSWER_CONFIDENCE, ANSWER_SOURCES
+from utils import get_cache_service, user_in_company_cached
 
 router = APIRouter(prefix="/search", tags=["search"])
 
-# Initialize services lazily to avoid import-time errors
-cache_service = CacheService()
-recommendation_service = RecommendationService(cache_service)
+# Recent queries passed to the LLM as context / kept in the cached history
+CONTEXT_QUERY_COUNT = 3
+HISTORY_CACHE_SIZE = 5
+
+
+async def _check_membership(db: Session, cache_service: CacheService, request: SearchRequest) -> None:
+    """Reject a search from a user outside the given company"""
+    if not await user_in_company_cached(db, cache_service, request.user_id, request.company_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid user or company"
+        )
+
+
+def _recent_queries(db: Session, request: SearchRequest) -> list:
+    """
+    Fetch recent queries once: the newest three are the LLM context and
+    the rest backfill the cached history after this query is saved.
+    Only the cached columns are selected, as plain rows
+    """
+    return db.query(Query.id, Query.query_text, Query.created_at).filter(
+        Query.user_id == request.user_id,
+        Query.company_id == request.company_id
+    ).order_by(Query.created_at.desc()).limit(HISTORY_CACHE_SIZE).all()
+
+
+def _save_failed_query(db: Session, request: SearchRequest) -> None:
+    """Save the query even if the LLM fails, but don't save error documents"""
+    db.execute(insert(Query).values(
+        query_text=request.query,
+        user_id=request.user_id,
+        company_id=request.company_id
+    ))
+    db.commit()
+
+
+async def _save_search(
+    db: Session,
+    cache_service: CacheService,
+    request: SearchRequest,
+    recent_queries: list,
+    llm_response: Dict
+) -> Optional[int]:
+    """
+    Save the query, and the answer as a document if requested, then refresh
+    the user's cached history. Returns the new document's id, if any.
+    """
+    # Save query to database; RETURNING hands back the generated columns
+    # the cached history needs without a refresh
+    db_query = db.execute(
+        insert(Query).values(
+            query_text=request.query,
+            user_id=request.user_id,
+            company_id=request.company_id
+        ).returning(Query.id, Query.query_text, Query.created_at)
+    ).one()
+    
+    document_id = None
+    
+    # Save as document if requested (only save successful responses)
+    if request.save_as_document and llm_response.get("success", False):
+        document_id = db.execute(
+            insert(Document).values(
+                title=llm_response["title"],
+                content=llm_response["answer"],
+                source=llm_response["sources"][0] if llm_response["sources"] else "LLM Generated",
+                confidence=llm_response["confidence"],
+                created_by_user_id=request.user_id,
+                company_id=request.company_id
+            ).returning(Document.id)
+        ).scalar_one()
+    
+    # Query and document are committed together
+    db.commit()
+    
+    # Update cached query history
+    all_queries = [db_query] + recent_queries[:HISTORY_CACHE_SIZE - 1]
+    
+    query_cache_data = [
+        {
+            "id": q.id,
+            "query_text": q.query_text,
+            "created_at": q.created_at
+        }
+        for q in all_queries
+    ]
+    # Invalidate the user's cached recommendations and re-cache the
+    # query history in a single pipeline
+    await cache_service.invalidate_user_cache(request.user_id, query_history=query_cache_data)
+    
+    return document_id
 
 
 @router.post("/", response_model=SearchResponse)
 async def search_and_generate(
     request: SearchRequest,
+    cache_service: CacheService = Depends(get_cache_service),
     db: Session = Depends(get_db)
 ):
     """
     Process user query, generate LLM response, and optionally save as document
     """
-    # Validate user and company
-    user = db.query(User).filter(
-        User.id == request.user_id,
-        User.company_id == request.company_id
-    ).first()
-    
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid user or company"
-        )
+    # Validate user belongs to company
+    await _check_membership(db, cache_service, request)
     
     try:
-        # Get recent context from user's queries
-        recent_queries = db.query(Query).filter(
-            Query.user_id == request.user_id,
-            Query.company_id == request.company_id
-        ).order_by(Query.created_at.desc()).limit(3).all()
-        
-        context = [q.query_text for q in recent_queries] if recent_queries else []
+        recent_queries = _recent_queries(db, request)
+        context = [q.query_text for q in recent_queries[:CONTEXT_QUERY_COUNT]]
         
         # Generate answer using LLM (lazy initialization)
         llm_service = LLMService()
@@ -48,14 +128,7 @@ async def search_and_generate(
         try:
             llm_response = await llm_service.generate_answer(request.query, context)
         except Exception as llm_error:
-            # Save query even if LLM fails, but don't save error documents
-            db_query = Query(
-                query_text=request.query,
-                user_id=request.user_id,
-                company_id=request.company_id
-            )
-            db.add(db_query)
-            db.commit()
+            _save_failed_query(db, request)
             
             # Return error response without saving document
             raise HTTPException(
@@ -63,50 +136,7 @@ async def search_and_generate(
                 detail=f"Unable to generate answer: {str(llm_error)}"
             )
         
-        # Save query to database
-        db_query = Query(
-            query_text=request.query,
-            user_id=request.user_id,
-            company_id=request.company_id
-        )
-        db.add(db_query)
-        db.commit()
-        
-        document_id = None
-        
-        # Save as document if requested (only save successful responses)
-        if request.save_as_document and llm_response.get("success", False):
-            db_document = Document(
-                title=llm_response["title"],
-                content=llm_response["answer"],
-                source=llm_response["sources"][0] if llm_response["sources"] else "LLM Generated",
-                confidence=llm_response["confidence"],
-                created_by_user_id=request.user_id,
-                company_id=request.company_id
-            )
-            db.add(db_document)
-            db.commit()
-            db.refresh(db_document)
-            document_id = db_document.id
-        
-        # Update user profile for recommendations (invalidate cache)
-        await recommendation_service.update_user_profile(request.user_id, request.query)
-        
-        # Update cached query history
-        all_queries = db.query(Query).filter(
-            Query.user_id == request.user_id,
-            Query.company_id == request.company_id
-        ).order_by(Query.created_at.desc()).limit(5).all()
-        
-        query_cache_data = [
-            {
-                "id": q.id,
-                "query_text": q.query_text,
-                "created_at": q.created_at.isoformat()
-            }
-            for q in all_queries
-        ]
-        await cache_service.cache_query_history(request.user_id, query_cache_data)
+        document_id = await _save_search(db, cache_service, request, recent_queries, llm_response)
         
         return SearchResponse(
             query=request.query,
@@ -123,31 +153,94 @@ async def search_and_generate(
         )
 
 
+@router.post("/stream")
+async def search_and_stream(
+    request: SearchRequest,
+    cache_service: CacheService = Depends(get_cache_service),
+    db: Session = Depends(get_db)
+):
+    """
+    Process user query and stream the LLM answer as plain text while it is
+    generated. The query (and document, if requested) is saved once the
+    answer is complete.
+    """
+    await _check_membership(db, cache_service, request)
+    
+    recent_queries = _recent_queries(db, request)
+    context = [q.query_text for q in recent_queries[:CONTEXT_QUERY_COUNT]]
+    
+    # Wait for the first chunk before responding, so an unavailable model
+    # still gets a 503 instead of an empty 200
+    try:
+        llm_service = LLMService()
+        chunks = llm_service.generate_answer_stream(request.query, context)
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = ""
+    except Exception as llm_error:
+        _save_failed_query(db, request)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Unable to generate answer: {str(llm_error)}"
+        )
+    
+    async def stream_answer():
+        answer_parts = [first_chunk]
+        yield first_chunk
+        # The request's session is done once the handler returns, and the
+        # stream outlives it, so the answer is saved through its own session
+        with Session(engine) as stream_db:
+            try:
+                async for chunk in chunks:
+                    answer_parts.append(chunk)
+                    yield chunk
+            except Exception:
+                # The response has already started; keep the query, drop the partial answer
+                _save_failed_query(stream_db, request)
+                raise
+            
+            llm_response = {
+                "answer": "".join(answer_parts),
+                "title": "",
+                "sources": ANSWER_SOURCES,
+                "confidence": ANSWER_CONFIDENCE,
+                "success": True
+            }
+            if request.save_as_document:
+                # Titled by the model like POST /search/; without a title only the query is saved
+                try:
+                    llm_response["title"] = await llm_service.generate_title(request.query, llm_response["answer"])
+                except Exception:
+                    llm_response["success"] = False
+            
+            await _save_search(stream_db, cache_service, request, recent_queries, llm_response)
+    
+    return StreamingResponse(stream_answer(), media_type="text/plain")
+
+
 @router.get("/queries/{user_id}", response_model=List[QueryResponse])
 async def get_user_queries(
     user_id: int,
     company_id: int,
     skip: int = 0,
     limit: int = 10,
+    cache_service: CacheService = Depends(get_cache_service),
     db: Session = Depends(get_db)
 ):
     """
     Get user's query history (scoped to company for security)
     """
     # Validate user belongs to company
-    user = db.query(User).filter(
-        User.id == user_id,
-        User.company_id == company_id
-    ).first()
-    
-    if not user:
+    if not await user_in_company_cached(db, cache_service, user_id, company_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid user or company"
         )
     
-    # Get queries with proper scoping
-    queries = db.query(Query).filter(
+    # Get queries with proper scoping, loading the nested user/company in the same SELECT
+    queries = db.query(Query).options(
+        joinedload(Query.user).joinedload(User.company)
+    ).filter(
         Query.user_id == user_id,
         Query.company_id == company_id
     ).order_by(Query.created_at.desc()).offset(skip).limit(limit).all()
@@ -160,6 +253,7 @@ async def delete_query(
     query_id: int,
     user_id: int,
     company_id: int,
+    cache_service: CacheService = Depends(get_cache_service),
     db: Session = Depends(get_db)
 ):
     """
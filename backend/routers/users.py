@@ -1,9 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
 
 from models import get_db, User, Company
 from schemas import UserCreate, UserResponse
+from services import CacheService
+from utils import get_cache_service
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -30,16 +34,82 @@ async def create_user(
             detail="User with this email already exists"
         )
     
-    db_user = User(
-        name=user.name,
-        email=user.email,
-        company_id=user.company_id
-    )
-    db.add(db_user)
+    try:
+        db_user = db.execute(
+            insert(User).values(
+                name=user.name,
+                email=user.email,
+                company_id=user.company_id
+            ).returning(User)
+        ).scalar_one()
+    except IntegrityError:
+        # A concurrent request took the email after the check above
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="User with this email already exists"
+        )
+    
+    # Build the response from the RETURNING row before commit expires it;
+    # the company is already in the session from the check above
+    response = UserResponse.model_validate(db_user)
+    db.commit()
+    
+    return response
+
+
+@router.post("/bulk", response_model=List[UserResponse], status_code=status.HTTP_201_CREATED)
+def create_users(
+    users: List[UserCreate],
+    db: Session = Depends(get_db)
+):
+    """Create several users in one request; none are created if any fails validation"""
+    # Check that every company exists, in one query
+    company_ids = {user.company_id for user in users}
+    found = db.query(Company).filter(Company.id.in_(company_ids)).all()
+    if len(found) != len(company_ids):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Company not found"
+        )
+    
+    # Check that no email is repeated or already taken
+    emails = [user.email for user in users]
+    if len(set(emails)) != len(emails):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="User emails must be unique"
+        )
+    taken = [email for (email,) in db.query(User.email).filter(User.email.in_(emails))]
+    if taken:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Users with these emails already exist: {', '.join(taken)}"
+        )
+    
+    if not users:
+        return []
+    
+    # One multi-row INSERT, returning the new rows
+    try:
+        db_users = db.scalars(
+            insert(User).returning(User),
+            [{"name": user.name, "email": user.email, "company_id": user.company_id} for user in users]
+        ).all()
+    except IntegrityError:
+        # A concurrent request took one of the emails after the check above
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="User with this email already exists"
+        )
+    
+    # Build the responses from the RETURNING rows before commit expires them;
+    # the companies are already in the session from the check above
+    response = [UserResponse.model_validate(user) for user in db_users]
     db.commit()
-    db.refresh(db_user)
     
-    return db_user
+    return response
 
 
 @router.get("/", response_model=List[UserResponse])
@@ -50,7 +120,8 @@ async def get_users(
     db: Session = Depends(get_db)
 ):
     """Get users, optionally filtered by company"""
-    query = db.query(User)
+    # Load each user's company in the same SELECT instead of once per row
+    query = db.query(User).options(joinedload(User.company))
     
     if company_id:
         query = query.filter(User.company_id == company_id)
@@ -78,6 +149,7 @@ async def get_user(
 async def update_user(
     user_id: int,
     user_update: UserCreate,
+    cache_service: CacheService = Depends(get_cache_service),
     db: Session = Depends(get_db)
 ):
     """Update a user"""
@@ -105,18 +177,24 @@ async def update_user(
                 detail="User with this email already exists"
             )
     
+    previous_company_id = user.company_id
     user.name = user_update.name
     user.email = user_update.email
     user.company_id = user_update.company_id
     db.commit()
     db.refresh(user)
     
+    # Drop the cached membership if the user moved to another company
+    if previous_company_id != user.company_id:
+        await cache_service.invalidate_user_membership(user_id, previous_company_id)
+    
     return user
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_user(
     user_id: int,
+    cache_service: CacheService = Depends(get_cache_service),
     db: Session = Depends(get_db)
 ):
     """Delete a user"""
@@ -127,9 +205,12 @@ async def delete_user(
             detail="User not found"
         )
     
+    company_id = user.company_id
     db.delete(user)
     db.commit()
     
+    await cache_service.invalidate_user_membership(user_id, company_id)
+    
     return None
 
 
@@ -138,19 +219,23 @@ async def get_users_by_company(
     company_id: int,
     skip: int = 0,
     limit: int = 100,
+    after_id: Optional[int] = None,
     db: Session = Depends(get_db)
 ):
-    """Get all users for a specific company"""
-    # Verify company exists
-    company = db.query(Company).filter(Company.id == company_id).first()
-    if not company:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Company not found"
-        )
-    
-    users = db.query(User).filter(
+    """
+    Get all users for a specific company. Pass the last user id seen as
+    after_id to page with a primary-key seek instead of OFFSET.
+    An unknown company yields an empty list.
+    """
+    query = db.query(User).options(joinedload(User.company)).filter(
         User.company_id == company_id
-    ).offset(skip).limit(limit).all()
+    ).order_by(User.id)
+    
+    if after_id is not None:
+        query = query.filter(User.id > after_id)
+    else:
+        query = query.offset(skip)
     
-    return users
\ No newline at end of file
+    users = query.limit(limit).all()
+    
+    return users
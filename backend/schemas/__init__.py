@@ -1,17 +1,17 @@
 from .schemas import (
     CompanyCreate, CompanyResponse,
     UserCreate, UserResponse,
-    DocumentCreate, DocumentResponse,
+    DocumentCreate, DocumentResponse, DocumentSummaryResponse,
     QueryCreate, QueryResponse,
     SearchRequest, SearchResponse,
-    RecommendationResponse
+    BatchRecommendationRequest, RecommendationResponse
 )
 
 __all__ = [
     "CompanyCreate", "CompanyResponse",
     "UserCreate", "UserResponse", 
-    "DocumentCreate", "DocumentResponse",
+    "DocumentCreate", "DocumentResponse", "DocumentSummaryResponse",
     "QueryCreate", "QueryResponse",
     "SearchRequest", "SearchResponse",
-    "RecommendationResponse"
+    "BatchRecommendationRequest", "RecommendationResponse"
 ]
\ No newline at end of file
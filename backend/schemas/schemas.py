@@ -64,6 +64,21 @@ class DocumentResponse(DocumentBase):
         from_attributes = True
 
 
+class DocumentSummaryResponse(BaseModel):
+    """Document metadata for list views, without the content body"""
+    id: int
+    title: str
+    source: Optional[str] = "LLM Generated"
+    confidence: Optional[float] = 0.8
+    created_by_user_id: int
+    company_id: int
+    created_at: datetime
+    created_by_user: UserResponse
+    
+    class Config:
+        from_attributes = True
+
+
 # Query Schemas
 class QueryBase(BaseModel):
     query_text: str
@@ -102,6 +117,12 @@ class SearchResponse(BaseModel):
 
 
 # Recommendation Schemas
+class BatchRecommendationRequest(BaseModel):
+    user_ids: List[int]
+    company_id: int
+    limit: int = 10
+
+
 class RecommendationResponse(BaseModel):
     id: int
     title: str
@@ -1,5 +1,6 @@
 from .llm_service import LLMService
 from .recommendation_service import RecommendationService
 from .cache_service import CacheService
+from .simple_recommendation_service import SimpleRecommendationService
 
-__all__ = ["LLMService", "RecommendationService", "CacheService"]
\ No newline at end of file
+__all__ = ["LLMService", "RecommendationService", "CacheService", "SimpleRecommendationService"]
\ No newline at end of file
@@ -1,26 +1,50 @@
-import redis
-import json
+import redis.asyncio as redis
+import numpy as np
+import orjson
+import xxhash
+import io
 import os
-from typing import List, Dict, Optional
+from scipy import sparse
+from typing import List, Dict, Optional, Tuple
 from datetime import timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Naive datetimes are stored as UTC and numpy scalars/arrays from the
+# recommendation engine serialize without manual conversion
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY
+
 class CacheService:
     def __init__(self):
         redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
-        self.redis_client = redis.from_url(redis_url, decode_responses=True)
+        # Shared pool so concurrent requests reuse connections instead of opening new ones
+        pool = redis.ConnectionPool.from_url(redis_url, max_connections=50)
+        self.redis_client = redis.Redis(connection_pool=pool)
         
         # Cache TTL settings
         self.QUERY_HISTORY_TTL = timedelta(hours=24)
         self.RECOMMENDATIONS_TTL = timedelta(minutes=5)  # Reduced for testing 
         self.INTENT_TTL = timedelta(hours=6)
+        self.EXCEL_RESULT_TTL = timedelta(hours=24)
+        self.MEMBERSHIP_TTL = timedelta(minutes=5)
+        self.CORPUS_TTL = timedelta(hours=1)
     
     def _get_user_key(self, user_id: int, key_type: str) -> str:
         """Generate Redis key for user-specific data"""
         return f"user:{user_id}:{key_type}"
     
+    def _set_user_key(self, pipe, user_id: int, key_type: str, ttl: timedelta, value: bytes) -> None:
+        """
+        Queue a user-scoped SETEX on a pipeline and record the key in the
+        user's key index so invalidation never has to scan the keyspace.
+        """
+        key = self._get_user_key(user_id, key_type)
+        index_key = self._get_user_key(user_id, "keys")
+        pipe.setex(key, ttl, value)
+        pipe.sadd(index_key, key)
+        pipe.expire(index_key, self.QUERY_HISTORY_TTL)
+    
     def _get_company_key(self, company_id: int, key_type: str) -> str:
         """Generate Redis key for company-specific data"""
         return f"company:{company_id}:{key_type}"
@@ -28,15 +52,18 @@ class CacheService:
     async def cache_query_history(self, user_id: int, queries: List[Dict]) -> bool:
         """Cache the last 5 queries for a user"""
         try:
-            key = self._get_user_key(user_id, "query_history")
             # Keep only last 5 queries
             queries_data = queries[-5:] if len(queries) > 5 else queries
             
-            self.redis_client.setex(
-                key,
+            pipe = self.redis_client.pipeline()
+            self._set_user_key(
+                pipe,
+                user_id,
+                "query_history",
                 self.QUERY_HISTORY_TTL,
-                json.dumps(queries_data)
+                orjson.dumps(queries_data, option=ORJSON_OPTIONS)
             )
+            await pipe.execute()
             return True
         except Exception as e:
             print(f"Error caching query history: {str(e)}")
@@ -46,10 +73,10 @@ class CacheService:
         """Retrieve cached query history for a user"""
         try:
             key = self._get_user_key(user_id, "query_history")
-            cached_data = self.redis_client.get(key)
+            cached_data = await self.redis_client.get(key)
             
             if cached_data:
-                return json.loads(cached_data)
+                return orjson.loads(cached_data)
             return []
         except Exception as e:
             print(f"Error retrieving query history: {str(e)}")
@@ -58,13 +85,15 @@ class CacheService:
     async def cache_recommendations(self, user_id: int, recommendations: List[Dict]) -> bool:
         """Cache recommendations for a user"""
         try:
-            key = self._get_user_key(user_id, "recommendations")
-            
-            self.redis_client.setex(
-                key,
+            pipe = self.redis_client.pipeline()
+            self._set_user_key(
+                pipe,
+                user_id,
+                "recommendations",
                 self.RECOMMENDATIONS_TTL,
-                json.dumps(recommendations)
+                orjson.dumps(recommendations, option=ORJSON_OPTIONS)
             )
+            await pipe.execute()
             return True
         except Exception as e:
             print(f"Error caching recommendations: {str(e)}")
@@ -74,27 +103,31 @@ class CacheService:
         """Retrieve cached recommendations for a user"""
         try:
             key = self._get_user_key(user_id, "recommendations")
-            cached_data = self.redis_client.get(key)
+            cached_data = await self.redis_client.get(key)
             
             if cached_data:
-                return json.loads(cached_data)
+                return orjson.loads(cached_data)
             return None
         except Exception as e:
             print(f"Error retrieving recommendations: {str(e)}")
             return None
     
+    def _get_intent_key(self, query: str) -> str:
+        """
+        Generate Redis key for a query's intent. The query is hashed to keep
+        keys short; xxh3 is used because the hash needs no cryptographic strength.
+        """
+        return f"intent:{xxhash.xxh3_64_hexdigest(query)}"
+    
     async def cache_intent(self, query: str, intent_data: Dict) -> bool:
         """Cache intent detection results"""
         try:
-            # Use query hash as key to avoid key length issues
-            import hashlib
-            query_hash = hashlib.md5(query.encode()).hexdigest()
-            key = f"intent:{query_hash}"
+            key = self._get_intent_key(query)
             
-            self.redis_client.setex(
+            await self.redis_client.setex(
                 key,
                 self.INTENT_TTL,
-                json.dumps(intent_data)
+                orjson.dumps(intent_data, option=ORJSON_OPTIONS)
             )
             return True
         except Exception as e:
@@ -104,34 +137,195 @@ class CacheService:
     async def get_intent(self, query: str) -> Optional[Dict]:
         """Retrieve cached intent for a query"""
         try:
-            import hashlib
-            query_hash = hashlib.md5(query.encode()).hexdigest()
-            key = f"intent:{query_hash}"
+            key = self._get_intent_key(query)
             
-            cached_data = self.redis_client.get(key)
+            cached_data = await self.redis_client.get(key)
             if cached_data:
-                return json.loads(cached_data)
+                return orjson.loads(cached_data)
             return None
         except Exception as e:
             print(f"Error retrieving intent: {str(e)}")
             return None
     
-    async def invalidate_user_cache(self, user_id: int) -> bool:
-        """Invalidate all cached data for a user"""
+    async def cache_excel_result(self, kind: str, content_hash: str, result: Dict) -> bool:
+        """Cache an Excel validation result keyed by the file's content hash"""
+        try:
+            key = f"excel:{kind}:{content_hash}"
+            
+            await self.redis_client.setex(
+                key,
+                self.EXCEL_RESULT_TTL,
+                orjson.dumps(result, option=ORJSON_OPTIONS)
+            )
+            return True
+        except Exception as e:
+            print(f"Error caching Excel result: {str(e)}")
+            return False
+    
+    async def get_excel_result(self, kind: str, content_hash: str) -> Optional[Dict]:
+        """Retrieve a cached Excel result for a file content hash"""
+        try:
+            key = f"excel:{kind}:{content_hash}"
+            
+            cached_data = await self.redis_client.get(key)
+            if cached_data:
+                return orjson.loads(cached_data)
+            return None
+        except Exception as e:
+            print(f"Error retrieving Excel result: {str(e)}")
+            return None
+    
+    def _get_corpus_key(self, company_id: int, version: str) -> str:
+        """Generate Redis key for a company's TF-IDF corpus index at a given version"""
+        return f"tfidf:{company_id}:{version}"
+    
+    async def get_corpus_generation(self, company_id: int) -> int:
+        """Counter bumped whenever a company document is edited or deleted"""
         try:
-            pattern = self._get_user_key(user_id, "*")
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                self.redis_client.delete(*keys)
+            key = self._get_company_key(company_id, "corpus_generation")
+            return int(await self.redis_client.get(key) or 0)
+        except Exception as e:
+            print(f"Error retrieving corpus generation: {str(e)}")
+            return 0
+    
+    async def bump_corpus_generation(self, company_id: int) -> bool:
+        """Invalidate a company's cached corpus index after a document changes in place"""
+        try:
+            key = self._get_company_key(company_id, "corpus_generation")
+            await self.redis_client.incr(key)
+            return True
+        except Exception as e:
+            print(f"Error bumping corpus generation: {str(e)}")
+            return False
+    
+    async def cache_corpus_tfidf(self, company_id: int, version: str, idf: np.ndarray, doc_matrix: sparse.csr_matrix) -> bool:
+        """
+        Cache a company's IDF weights and document TF-IDF matrix. The CSR
+        arrays are stored as a raw .npz payload, so loading is a single GET
+        plus a copy-free array read instead of a corpus scan and refit.
+        Matrix weights are stored as float16, halving the payload; cosine
+        scores are re-ranked by boosts, so the lost precision does not matter.
+        """
+        try:
+            buffer = io.BytesIO()
+            np.savez(
+                buffer,
+                idf=idf,
+                data=doc_matrix.data.astype(np.float16),
+                indices=doc_matrix.indices,
+                indptr=doc_matrix.indptr,
+                shape=np.array(doc_matrix.shape)
+            )
+            
+            await self.redis_client.setex(
+                self._get_corpus_key(company_id, version),
+                self.CORPUS_TTL,
+                buffer.getvalue()
+            )
+            return True
+        except Exception as e:
+            print(f"Error caching corpus index: {str(e)}")
+            return False
+    
+    async def get_corpus_tfidf(self, company_id: int, version: str) -> Optional[Tuple[np.ndarray, sparse.csr_matrix]]:
+        """Retrieve a cached (idf, document matrix) pair for a corpus version"""
+        try:
+            cached_data = await self.redis_client.get(self._get_corpus_key(company_id, version))
+            if not cached_data:
+                return None
+            
+            with np.load(io.BytesIO(cached_data), allow_pickle=False) as arrays:
+                doc_matrix = sparse.csr_matrix(
+                    (arrays["data"].astype(np.float32), arrays["indices"], arrays["indptr"]),
+                    shape=tuple(arrays["shape"])
+                )
+                return arrays["idf"], doc_matrix
+        except Exception as e:
+            print(f"Error retrieving corpus index: {str(e)}")
+            return None
+    
+    def _get_membership_key(self, user_id: int, company_id: int) -> str:
+        """Generate Redis key for a user/company membership check"""
+        return f"auth:{user_id}:{company_id}"
+    
+    async def is_user_in_company(self, user_id: int, company_id: int) -> bool:
+        """Check for a cached positive membership result; False means unknown"""
+        try:
+            key = self._get_membership_key(user_id, company_id)
+            return bool(await self.redis_client.exists(key))
+        except Exception as e:
+            print(f"Error retrieving membership: {str(e)}")
+            return False
+    
+    async def cache_user_membership(self, user_id: int, company_id: int) -> bool:
+        """Remember that a user belongs to a company"""
+        try:
+            key = self._get_membership_key(user_id, company_id)
+            await self.redis_client.set(key, "1", ex=self.MEMBERSHIP_TTL)
+            return True
+        except Exception as e:
+            print(f"Error caching membership: {str(e)}")
+            return False
+    
+    async def invalidate_user_membership(self, user_id: int, company_id: int) -> bool:
+        """Forget a cached membership after the user is moved or deleted"""
+        try:
+            key = self._get_membership_key(user_id, company_id)
+            await self.redis_client.delete(key)
+            return True
+        except Exception as e:
+            print(f"Error invalidating membership: {str(e)}")
+            return False
+    
+    async def invalidate_company_memberships(self, company_id: int, user_ids: List[int]) -> bool:
+        """Forget the cached memberships of a deleted company's users"""
+        try:
+            if user_ids:
+                await self.redis_client.delete(
+                    *(self._get_membership_key(user_id, company_id) for user_id in user_ids)
+                )
+            return True
+        except Exception as e:
+            print(f"Error invalidating company memberships: {str(e)}")
+            return False
+    
+    async def invalidate_user_cache(self, user_id: int, query_history: Optional[List[Dict]] = None) -> bool:
+        """
+        Invalidate all cached data for a user. When query_history is given it
+        is re-cached in the same pipeline, saving a separate round trip.
+        """
+        try:
+            index_key = self._get_user_key(user_id, "keys")
+            keys = await self.redis_client.smembers(index_key)
+            if not keys:
+                # Keys written before the index existed: fall back to an incremental SCAN
+                pattern = self._get_user_key(user_id, "*")
+                keys = [key async for key in self.redis_client.scan_iter(match=pattern, count=500)]
+            
+            pipe = self.redis_client.pipeline()
+            pipe.delete(index_key, *keys)
+            if query_history is not None:
+                self._set_user_key(
+                    pipe,
+                    user_id,
+                    "query_history",
+                    self.QUERY_HISTORY_TTL,
+                    orjson.dumps(query_history[-5:], option=ORJSON_OPTIONS)
+                )
+            await pipe.execute()
             return True
         except Exception as e:
             print(f"Error invalidating user cache: {str(e)}")
             return False
     
+    async def close(self) -> None:
+        """Release the Redis connection pool"""
+        await self.redis_client.aclose()
+    
     async def health_check(self) -> bool:
         """Check if Redis is available"""
         try:
-            self.redis_client.ping()
+            await self.redis_client.ping()
             return True
         except Exception:
             return False
\ No newline at end of file
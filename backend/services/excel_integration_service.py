@@ -3,15 +3,245 @@ Excel Integration Service for Real-Time Activity Report Processing
 Handles Excel files with company, user, and query data for real-time recommendations.
 """
 import pandas as pd
+import asyncio
+import csv
+import io
 import logging
-from typing import Dict, List, Optional, Any
-from datetime import datetime
+import openpyxl
+from python_calamine import CalamineWorkbook
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Optional, Any, Tuple, Union
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, desc, func, insert, select
 from sqlalchemy.orm import Session
 from models.models import Company, User, Query, Document
 from models.database import get_db
 
 logger = logging.getLogger(__name__)
 
+# Columns read from each activity report sheet, with the dtype each is parsed
+# as. Text is read as str so pandas skips type inference; timestamp and
+# confidence stay as parsed cells and are coerced during import.
+REPORT_COLUMNS = {
+    "Companies": {"name": str, "industry": str},
+    "Users": {"name": str, "email": str, "company_name": str},
+    "Queries": {"user_email": str, "company_name": str, "query_text": str, "timestamp": object},
+    "Documents": {"title": str, "content": str, "user_email": str, "company_name": str, "confidence": object},
+}
+
+# Sheets of an activity report, in the order they must be written to the database
+REPORT_SHEETS = tuple(REPORT_COLUMNS)
+
+# Rows imported and committed per batch, bounding per-batch memory on large sheets
+IMPORT_CHUNK_ROWS = 10_000
+
+
+def _parse_sheet(workbook: pd.ExcelFile, sheet_name: str) -> pd.DataFrame:
+    """
+    Parse one sheet, reading only the report's columns for that sheet.
+    Sheets that are not part of the report are read as headers only.
+    """
+    columns = REPORT_COLUMNS.get(sheet_name)
+    if columns is None:
+        return workbook.parse(sheet_name, nrows=0)
+    return workbook.parse(
+        sheet_name,
+        # Header cells are matched the way _prepare_sheet normalizes them
+        usecols=lambda column: str(column).strip() in columns,
+        dtype=columns
+    )
+
+
+def _parse_workbook(
+    workbook: pd.ExcelFile,
+    sheet_name: Optional[str]
+) -> Union[pd.DataFrame, Dict[str, pd.DataFrame]]:
+    """Parse one sheet, or every sheet when sheet_name is None"""
+    if sheet_name is not None:
+        return _parse_sheet(workbook, sheet_name)
+    return {name: _parse_sheet(workbook, name) for name in workbook.sheet_names}
+
+
+def read_excel_sheets(
+    excel_file_path: str,
+    sheet_name: Optional[str] = None,
+    read_only: bool = True
+) -> Union[pd.DataFrame, Dict[str, pd.DataFrame]]:
+    """
+    Load one sheet (or every sheet when sheet_name is None) into DataFrames.
+    
+    Parses with the Rust-based calamine engine and falls back to openpyxl
+    for workbooks calamine cannot read. read_only makes openpyxl stream rows
+    instead of materializing the full cell grid. Defined at module level so
+    it can be run in a worker process.
+    """
+    try:
+        with pd.ExcelFile(excel_file_path, engine="calamine") as workbook:
+            return _parse_workbook(workbook, sheet_name)
+    except Exception as e:
+        logger.warning(f"calamine could not parse {excel_file_path}, falling back to openpyxl: {e}")
+    
+    with pd.ExcelFile(
+        excel_file_path,
+        engine="openpyxl",
+        engine_kwargs={"read_only": read_only, "data_only": True, "keep_links": False}
+    ) as workbook:
+        return _parse_workbook(workbook, sheet_name)
+
+
+def read_sheet_names(excel_file_path: str) -> List[str]:
+    """List the workbook's sheet names without parsing any cells"""
+    try:
+        with pd.ExcelFile(excel_file_path, engine="calamine") as workbook:
+            return workbook.sheet_names
+    except Exception:
+        with pd.ExcelFile(excel_file_path, engine="openpyxl") as workbook:
+            return workbook.sheet_names
+
+
+def read_sheet_headers(
+    excel_file_path: str,
+    read_only: bool = True
+) -> Dict[str, Tuple[List[Any], int]]:
+    """
+    Read each sheet's header row and data row count without building
+    DataFrames, which is all format validation needs.
+    """
+    try:
+        workbook = CalamineWorkbook.from_path(excel_file_path)
+        headers = {}
+        for name in workbook.sheet_names:
+            sheet = workbook.get_sheet_by_name(name)
+            rows = sheet.to_python(skip_empty_area=False, nrows=1)
+            # end is the last used (row, column); row 0 is the header
+            headers[name] = (_header_columns(rows[0] if rows else ()), sheet.end[0] if sheet.end else 0)
+        return headers
+    except Exception as e:
+        logger.warning(f"calamine could not read headers of {excel_file_path}, falling back to openpyxl: {e}")
+    
+    workbook = openpyxl.load_workbook(
+        excel_file_path, read_only=read_only, data_only=True, keep_links=False
+    )
+    try:
+        return {
+            sheet.title: (
+                _header_columns(next(sheet.iter_rows(max_row=1, values_only=True), ())),
+                max((sheet.max_row or 1) - 1, 0)
+            )
+            for sheet in workbook.worksheets
+        }
+    finally:
+        workbook.close()
+
+
+def _header_columns(header_row) -> List[Any]:
+    """Column names from a header row, skipping blank cells"""
+    return [cell for cell in header_row if cell not in (None, "")]
+
+
+def _prepare_sheet(df: pd.DataFrame, sheet_name: str) -> pd.DataFrame:
+    """
+    Normalize a sheet once before row iteration: trim header whitespace,
+    replace missing cells with '' so per-row code never sees NaN, and strip
+    the sheet's text columns with a vectorized str.strip per column.
+    """
+    df = df.rename(columns=lambda column: str(column).strip()).fillna('')
+    text_columns = [
+        column for column, dtype in REPORT_COLUMNS[sheet_name].items()
+        if dtype is str and column in df.columns
+    ]
+    for column in text_columns:
+        df[column] = df[column].astype(str).str.strip()
+    return df
+
+
+def _parse_timestamps(values: pd.Series) -> pd.Series:
+    """
+    Parse a timestamp column in one vectorized pass. ISO 8601 values take the
+    fast path; anything else is retried element-wise, and blanks or values
+    that still fail become the current time.
+    """
+    parsed = pd.to_datetime(values, errors='coerce', format='ISO8601')
+    retry = parsed.isna() & (values.astype('string').str.strip() != '')
+    if retry.any():
+        parsed[retry] = pd.to_datetime(values[retry], errors='coerce', format='mixed')
+    return parsed.fillna(pd.Timestamp(datetime.utcnow()))
+
+
+# PostgreSQL drivers whose connections can stream COPY FROM STDIN
+COPY_DRIVERS = ("psycopg", "psycopg2")
+
+
+def _bulk_insert(db: Session, model, rows: List[Dict[str, Any]]) -> None:
+    """
+    Insert rows that need no RETURNING. On PostgreSQL the rows are streamed
+    with COPY FROM STDIN, which skips per-row statement handling entirely;
+    other databases use an executemany INSERT.
+    """
+    connection = db.connection()
+    dialect = connection.dialect
+    if dialect.name != "postgresql" or dialect.driver not in COPY_DRIVERS:
+        db.execute(insert(model), rows)
+        return
+    
+    # COPY bypasses SQLAlchemy, so fill in Python-side column defaults here
+    table = model.__table__
+    defaults = {
+        column.name: column.default.arg if column.default.is_scalar else column.default.arg(None)
+        for column in table.columns
+        if column.default is not None
+        and (column.default.is_scalar or column.default.is_callable)
+        and column.name not in rows[0]
+    }
+    columns = list(rows[0]) + list(defaults)
+    values = [[*row.values(), *defaults.values()] for row in rows]
+    
+    preparer = dialect.identifier_preparer
+    copy_sql = "COPY {} ({}) FROM STDIN".format(
+        preparer.format_table(table),
+        ", ".join(preparer.quote(column) for column in columns)
+    )
+    
+    raw_connection = connection.connection.driver_connection
+    if dialect.driver == "psycopg":
+        with raw_connection.cursor() as cursor, cursor.copy(copy_sql) as copy:
+            for row in values:
+                copy.write_row(row)
+    else:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(values)
+        buffer.seek(0)
+        with raw_connection.cursor() as cursor:
+            cursor.copy_expert(f"{copy_sql} WITH (FORMAT csv)", buffer)
+
+
+def _count(model, *criteria):
+    """Scalar COUNT(*) subquery over one table"""
+    return select(func.count()).select_from(model).where(*criteria).scalar_subquery()
+
+
+# Insight statements are built once at import; every call reuses the cached
+# compiled SQL. All totals come back from a single SELECT of scalar subqueries
+INSIGHT_COUNTS = select(
+    _count(Company).label("companies"),
+    _count(User).label("users"),
+    _count(Query).label("queries"),
+    _count(Document).label("documents"),
+    _count(Query, Query.created_at >= bindparam("since")).label("recent_queries"),
+)
+
+# Aggregate on queries.company_id (covered by idx_queries_company_created) and
+# join companies only for the names
+TOP_ACTIVE_COMPANIES = (
+    select(Company.name, func.count().label("query_count"))
+    .select_from(Query)
+    .join(Company, Company.id == Query.company_id)
+    .group_by(Query.company_id, Company.name)
+    .order_by(desc("query_count"))
+    .limit(5)
+)
+
+
 class ExcelIntegrationService:
     """
     Service for processing Excel activity reports and integrating them into the recommendation system.
@@ -26,58 +256,67 @@ class ExcelIntegrationService:
     def __init__(self):
         self.logger = logger
     
+    def _read_sheets(self, excel_file_path: str, read_only: bool = True) -> Dict[str, pd.DataFrame]:
+        """Load every sheet of the workbook into DataFrames"""
+        return read_excel_sheets(excel_file_path, read_only=read_only)
+    
+    async def read_workbook(
+        self,
+        excel_file_path: str,
+        read_only: bool = True,
+        executor: Optional[Executor] = None
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        Load every sheet of the workbook off the event loop, parsing each one
+        in its own worker. Sheet parsing is CPU-bound, so a process pool
+        executor parses the report sheets concurrently; without one, the
+        sheets are read in parallel on the default thread pool, which still
+        overlaps the parts of the parse that run outside the GIL.
+        The result can be passed to both validate_excel_format and
+        process_activity_report so the file is parsed only once.
+        """
+        loop = asyncio.get_running_loop()
+        
+        # Even listing sheets opens the workbook, so keep it off the event loop too
+        sheet_names = await loop.run_in_executor(None, read_sheet_names, excel_file_path)
+        frames = await asyncio.gather(*(
+            loop.run_in_executor(executor, read_excel_sheets, excel_file_path, name, read_only)
+            for name in sheet_names
+        ))
+        return dict(zip(sheet_names, frames))
+    
     async def process_activity_report(
         self, 
-        excel_file_path: str, 
-        db: Session
+        excel_file: Union[str, Dict[str, pd.DataFrame]], 
+        db: Session,
+        read_only: bool = True,
+        executor: Optional[Executor] = None
     ) -> Dict[str, Any]:
         """
         Process an Excel activity report and update the database with new data.
         
         Args:
-            excel_file_path: Path to the Excel file
+            excel_file: Path to the Excel file, or its sheets as returned by read_workbook
             db: Database session
+            read_only: Load the workbook in openpyxl's streaming read-only mode
+            executor: Optional executor (e.g. a process pool) used to parse sheets in parallel
             
         Returns:
             Dict with processing results and statistics
         """
         try:
-            # Load Excel file
-            excel_data = pd.read_excel(excel_file_path, sheet_name=None)
-            
-            results = {
-                "companies_processed": 0,
-                "users_processed": 0,
-                "queries_processed": 0,
-                "documents_processed": 0,
-                "errors": []
-            }
-            
-            # Process companies first
-            if "Companies" in excel_data:
-                results["companies_processed"] = await self._process_companies(
-                    excel_data["Companies"], db
-                )
-            
-            # Process users
-            if "Users" in excel_data:
-                results["users_processed"] = await self._process_users(
-                    excel_data["Users"], db
-                )
-            
-            # Process queries 
-            if "Queries" in excel_data:
-                results["queries_processed"] = await self._process_queries(
-                    excel_data["Queries"], db
+            # Load Excel file unless the caller already parsed it
+            if isinstance(excel_file, str):
+                excel_data = await self.read_workbook(
+                    excel_file, read_only=read_only, executor=executor
                 )
+            else:
+                excel_data = excel_file
             
-            # Process documents
-            if "Documents" in excel_data:
-                results["documents_processed"] = await self._process_documents(
-                    excel_data["Documents"], db
-                )
-                
-            db.commit()
+            # Row processing and the commit are blocking, so run them on a
+            # worker thread rather than the event loop
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(None, self._import_report_data, excel_data, db)
             
             self.logger.info(f"Excel processing complete: {results}")
             return results
@@ -88,178 +327,266 @@ class ExcelIntegrationService:
             self.logger.error(error_msg)
             return {"error": error_msg, "success": False}
     
-    async def _process_companies(self, companies_df: pd.DataFrame, db: Session) -> int:
-        """Process companies from Excel data"""
-        processed = 0
+    def _import_report_data(self, excel_data: Dict[str, pd.DataFrame], db: Session) -> Dict[str, Any]:
+        """Write the parsed report sheets to the database, committing in chunks"""
+        results = {
+            "companies_processed": 0,
+            "users_processed": 0,
+            "queries_processed": 0,
+            "documents_processed": 0,
+            "errors": []
+        }
         
-        for _, row in companies_df.iterrows():
-            try:
-                company_name = row.get('name', '').strip()
-                if not company_name:
-                    continue
-                
-                # Check if company already exists
-                existing = db.query(Company).filter(Company.name == company_name).first()
-                if existing:
-                    continue
-                
-                # Create new company
-                company = Company(
-                    name=company_name,
-                    # Add other fields if available in Excel
-                )
-                db.add(company)
-                processed += 1
-                
-            except Exception as e:
-                self.logger.error(f"Error processing company {row}: {e}")
-                continue
+        # Preload lookups once; rows resolve names/emails with dict probes
+        # instead of a SELECT each, and new rows are added as they are flushed
+        company_ids = {name: company_id for company_id, name in db.query(Company.id, Company.name)}
+        user_ids = {email: user_id for user_id, email in db.query(User.id, User.email)}
+        
+        # Process companies first
+        if "Companies" in excel_data:
+            results["companies_processed"] = self._import_in_chunks(
+                excel_data["Companies"], db,
+                lambda chunk: self._process_companies(chunk, db, company_ids)
+            )
+        
+        # Process users
+        if "Users" in excel_data:
+            results["users_processed"] = self._import_in_chunks(
+                excel_data["Users"], db,
+                lambda chunk: self._process_users(chunk, db, company_ids, user_ids)
+            )
         
+        # Process queries 
+        if "Queries" in excel_data:
+            results["queries_processed"] = self._import_in_chunks(
+                excel_data["Queries"], db,
+                lambda chunk: self._process_queries(chunk, db, company_ids, user_ids)
+            )
+        
+        # Process documents
+        if "Documents" in excel_data:
+            results["documents_processed"] = self._import_in_chunks(
+                excel_data["Documents"], db,
+                lambda chunk: self._process_documents(chunk, db, company_ids, user_ids)
+            )
+        
+        return results
+    
+    def _import_in_chunks(
+        self,
+        sheet_df: pd.DataFrame,
+        db: Session,
+        process: Callable[[pd.DataFrame], int]
+    ) -> int:
+        """
+        Import a sheet IMPORT_CHUNK_ROWS rows at a time, committing after each
+        chunk. The per-chunk copies and insert payloads stay bounded, and
+        chunks already committed survive a failure later in the file. The
+        id lookups are updated as rows are inserted, so duplicates are still
+        caught across chunks.
+        """
+        processed = 0
+        for start in range(0, len(sheet_df), IMPORT_CHUNK_ROWS):
+            processed += process(sheet_df.iloc[start:start + IMPORT_CHUNK_ROWS])
+            db.commit()
         return processed
     
-    async def _process_users(self, users_df: pd.DataFrame, db: Session) -> int:
+    def _process_companies(
+        self,
+        companies_df: pd.DataFrame,
+        db: Session,
+        company_ids: Dict[str, int]
+    ) -> int:
+        """Process companies from Excel data"""
+        companies_df = _prepare_sheet(companies_df, "Companies")
+        if 'name' not in companies_df.columns:
+            return 0
+        
+        # Drop blanks, names already in the database and repeats within the sheet
+        # with column-wise masks rather than a per-row check
+        names = companies_df['name']
+        new_names = names[(names != '') & ~names.isin(company_ids.keys())].drop_duplicates()
+        if new_names.empty:
+            return 0
+        
+        # Insert the sheet in one executemany; RETURNING supplies the ids that
+        # later sheets reference
+        inserted = db.execute(
+            insert(Company).returning(Company.id, Company.name),
+            # Add other fields if available in Excel
+            [{"name": name} for name in new_names]
+        )
+        company_ids.update((name, company_id) for company_id, name in inserted)
+        
+        return len(new_names)
+    
+    def _process_users(
+        self,
+        users_df: pd.DataFrame,
+        db: Session,
+        company_ids: Dict[str, int],
+        user_ids: Dict[str, int]
+    ) -> int:
         """Process users from Excel data"""
-        processed = 0
+        users_df = _prepare_sheet(users_df, "Users")
+        columns = ['name', 'email', 'company_name']
+        if any(column not in users_df.columns for column in columns):
+            return 0
         
-        for _, row in users_df.iterrows():
-            try:
-                user_name = row.get('name', '').strip()
-                user_email = row.get('email', '').strip()
-                company_name = row.get('company_name', '').strip()
-                
-                if not all([user_name, user_email, company_name]):
-                    continue
-                
-                # Find company
-                company = db.query(Company).filter(Company.name == company_name).first()
-                if not company:
-                    self.logger.warning(f"Company '{company_name}' not found for user {user_email}")
-                    continue
-                
-                # Check if user already exists
-                existing = db.query(User).filter(User.email == user_email).first()
-                if existing:
-                    continue
-                
-                # Create new user
-                user = User(
-                    name=user_name,
-                    email=user_email,
-                    company_id=company.id
-                )
-                db.add(user)
-                processed += 1
-                
-            except Exception as e:
-                self.logger.error(f"Error processing user {row}: {e}")
-                continue
+        users = users_df[columns]
+        users = users[(users != '').all(axis=1)]
         
-        return processed
+        # Resolve companies for the whole sheet at once
+        users = users.assign(company_id=users['company_name'].map(company_ids))
+        for user_email, company_name in users.loc[users['company_id'].isna(), ['email', 'company_name']].itertuples(index=False):
+            self.logger.warning(f"Company '{company_name}' not found for user {user_email}")
+        
+        # Keep users with a known company that are not in the database or repeated in the sheet
+        new_users = users[
+            users['company_id'].notna() & ~users['email'].isin(user_ids.keys())
+        ].drop_duplicates('email')
+        if new_users.empty:
+            return 0
+        
+        # Insert the sheet in one executemany; RETURNING supplies the ids that
+        # queries/documents reference
+        inserted = db.execute(
+            insert(User).returning(User.id, User.email),
+            [
+                {"name": name, "email": email, "company_id": int(company_id)}
+                for name, email, company_id in new_users[['name', 'email', 'company_id']].itertuples(index=False)
+            ]
+        )
+        user_ids.update((email, user_id) for user_id, email in inserted)
+        
+        return len(new_users)
     
-    async def _process_queries(self, queries_df: pd.DataFrame, db: Session) -> int:
+    def _process_queries(
+        self,
+        queries_df: pd.DataFrame,
+        db: Session,
+        company_ids: Dict[str, int],
+        user_ids: Dict[str, int]
+    ) -> int:
         """Process queries from Excel data"""
-        processed = 0
+        queries_df = _prepare_sheet(queries_df, "Queries")
+        columns = ['user_email', 'company_name', 'query_text']
+        if any(column not in queries_df.columns for column in columns):
+            return 0
         
-        for _, row in queries_df.iterrows():
-            try:
-                user_email = row.get('user_email', '').strip()
-                company_name = row.get('company_name', '').strip()
-                query_text = row.get('query_text', '').strip()
-                timestamp_str = row.get('timestamp', '')
-                
-                if not all([user_email, company_name, query_text]):
-                    continue
-                
-                # Find user and company
-                user = db.query(User).filter(User.email == user_email).first()
-                company = db.query(Company).filter(Company.name == company_name).first()
-                
-                if not user or not company:
-                    self.logger.warning(f"User '{user_email}' or company '{company_name}' not found")
-                    continue
-                
-                # Parse timestamp
-                query_time = None
-                if timestamp_str:
-                    try:
-                        if isinstance(timestamp_str, str):
-                            query_time = pd.to_datetime(timestamp_str)
-                        else:
-                            query_time = timestamp_str
-                    except:
-                        query_time = datetime.utcnow()
-                else:
-                    query_time = datetime.utcnow()
-                
-                # Create query
-                query = Query(
-                    query_text=query_text,
-                    user_id=user.id,
-                    company_id=company.id,
-                    created_at=query_time
-                )
-                db.add(query)
-                processed += 1
-                
-            except Exception as e:
-                self.logger.error(f"Error processing query {row}: {e}")
-                continue
+        queries = queries_df[queries_df[columns].ne('').all(axis=1)]
+        queries = queries.assign(
+            user_id=queries['user_email'].map(user_ids),
+            company_id=queries['company_name'].map(company_ids)
+        )
         
-        return processed
+        # Resolve users and companies for the whole sheet at once
+        unresolved = queries['user_id'].isna() | queries['company_id'].isna()
+        for user_email, company_name in queries.loc[unresolved, ['user_email', 'company_name']].itertuples(index=False):
+            self.logger.warning(f"User '{user_email}' or company '{company_name}' not found")
+        queries = queries[~unresolved]
+        if queries.empty:
+            return 0
+        
+        # Parse the whole timestamp column up front; blanks and unparseable values import as now
+        query_times = _parse_timestamps(
+            queries['timestamp'] if 'timestamp' in queries.columns else pd.Series('', index=queries.index)
+        )
+        
+        new_queries = [
+            {
+                "query_text": query_text,
+                "user_id": int(user_id),
+                "company_id": int(company_id),
+                "created_at": query_time.to_pydatetime()
+            }
+            for query_text, user_id, company_id, query_time in zip(
+                queries['query_text'], queries['user_id'], queries['company_id'], query_times
+            )
+        ]
+        _bulk_insert(db, Query, new_queries)
+        
+        return len(new_queries)
     
-    async def _process_documents(self, documents_df: pd.DataFrame, db: Session) -> int:
+    def _process_documents(
+        self,
+        documents_df: pd.DataFrame,
+        db: Session,
+        company_ids: Dict[str, int],
+        user_ids: Dict[str, int]
+    ) -> int:
         """Process documents from Excel data"""
-        processed = 0
+        documents_df = _prepare_sheet(documents_df, "Documents")
+        columns = ['title', 'content', 'user_email', 'company_name']
+        if any(column not in documents_df.columns for column in columns):
+            return 0
         
-        for _, row in documents_df.iterrows():
-            try:
-                title = row.get('title', '').strip()
-                content = row.get('content', '').strip()
-                user_email = row.get('user_email', '').strip()
-                company_name = row.get('company_name', '').strip()
-                confidence = row.get('confidence', 0.8)
-                
-                if not all([title, content, user_email, company_name]):
-                    continue
-                
-                # Find user and company
-                user = db.query(User).filter(User.email == user_email).first()
-                company = db.query(Company).filter(Company.name == company_name).first()
-                
-                if not user or not company:
-                    continue
-                
-                # Create document
-                document = Document(
-                    title=title,
-                    content=content,
-                    source="Excel Import",
-                    confidence=float(confidence),
-                    created_by_user_id=user.id,
-                    company_id=company.id
-                )
-                db.add(document)
-                processed += 1
-                
-            except Exception as e:
-                self.logger.error(f"Error processing document {row}: {e}")
-                continue
+        # Keep complete rows whose user and company both resolve
+        documents = documents_df[documents_df[columns].ne('').all(axis=1)]
+        documents = documents.assign(
+            user_id=documents['user_email'].map(user_ids),
+            company_id=documents['company_name'].map(company_ids)
+        ).dropna(subset=['user_id', 'company_id'])
+        if documents.empty:
+            return 0
         
-        return processed
+        # Coerce once so bad values fall back to the default instead of failing float() per row
+        if 'confidence' in documents.columns:
+            confidences = pd.to_numeric(documents['confidence'], errors='coerce').fillna(0.8)
+        else:
+            confidences = pd.Series(0.8, index=documents.index)
+        
+        new_documents = [
+            {
+                "title": title,
+                "content": content,
+                "source": "Excel Import",
+                "confidence": float(confidence),
+                "created_by_user_id": int(user_id),
+                "company_id": int(company_id)
+            }
+            for title, content, confidence, user_id, company_id in zip(
+                documents['title'], documents['content'], confidences,
+                documents['user_id'], documents['company_id']
+            )
+        ]
+        _bulk_insert(db, Document, new_documents)
+        
+        return len(new_documents)
     
-    def validate_excel_format(self, excel_file_path: str) -> Dict[str, Any]:
+    def validate_excel_format(
+        self,
+        excel_file: Union[str, Dict[str, pd.DataFrame]],
+        read_only: bool = True,
+        deep: bool = False
+    ) -> Dict[str, Any]:
         """
         Validate Excel file format and return structure information.
         
+        Args:
+            excel_file: Path to the Excel file, or its sheets as returned by read_workbook
+            read_only: Load the workbook in openpyxl's streaming read-only mode
+            deep: Parse every sheet into DataFrames instead of reading only headers and row counts
+        
         Returns:
             Dict with validation results and sheet information
         """
         try:
-            excel_data = pd.read_excel(excel_file_path, sheet_name=None)
+            # Validation only needs each sheet's columns and row count
+            if isinstance(excel_file, str) and not deep:
+                sheet_headers = read_sheet_headers(excel_file, read_only=read_only)
+            else:
+                if isinstance(excel_file, str):
+                    excel_data = self._read_sheets(excel_file, read_only=read_only)
+                else:
+                    excel_data = excel_file
+                sheet_headers = {
+                    name: (list(df.columns), len(df)) for name, df in excel_data.items()
+                }
             
             validation = {
                 "valid": True,
-                "sheets": list(excel_data.keys()),
+                "sheets": list(sheet_headers.keys()),
                 "row_counts": {},
                 "missing_sheets": [],
                 "errors": []
@@ -268,28 +595,28 @@ class ExcelIntegrationService:
             # Check for expected sheets
             expected_sheets = ["Companies", "Users", "Queries"]
             for sheet in expected_sheets:
-                if sheet in excel_data:
-                    validation["row_counts"][sheet] = len(excel_data[sheet])
+                if sheet in sheet_headers:
+                    validation["row_counts"][sheet] = sheet_headers[sheet][1]
                 else:
                     validation["missing_sheets"].append(sheet)
             
             # Validate required columns
-            if "Companies" in excel_data:
-                companies_df = excel_data["Companies"]
-                if "name" not in companies_df.columns:
+            if "Companies" in sheet_headers:
+                companies_columns = sheet_headers["Companies"][0]
+                if "name" not in companies_columns:
                     validation["errors"].append("Companies sheet missing 'name' column")
             
-            if "Users" in excel_data:
-                users_df = excel_data["Users"]
+            if "Users" in sheet_headers:
+                users_columns = sheet_headers["Users"][0]
                 required_cols = ["name", "email", "company_name"]
-                missing_cols = [col for col in required_cols if col not in users_df.columns]
+                missing_cols = [col for col in required_cols if col not in users_columns]
                 if missing_cols:
                     validation["errors"].append(f"Users sheet missing columns: {missing_cols}")
             
-            if "Queries" in excel_data:
-                queries_df = excel_data["Queries"]
+            if "Queries" in sheet_headers:
+                queries_columns = sheet_headers["Queries"][0]
                 required_cols = ["user_email", "company_name", "query_text"]
-                missing_cols = [col for col in required_cols if col not in queries_df.columns]
+                missing_cols = [col for col in required_cols if col not in queries_columns]
                 if missing_cols:
                     validation["errors"].append(f"Queries sheet missing columns: {missing_cols}")
             
@@ -311,35 +638,25 @@ class ExcelIntegrationService:
         Returns:
             Dict with current system statistics and insights
         """
+        # The session is synchronous, so run the queries on a worker thread
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._collect_insights, db)
+    
+    def _collect_insights(self, db: Session) -> Dict[str, Any]:
+        """Run the insight queries for get_real_time_insights"""
         try:
-            companies = db.query(Company).count()
-            users = db.query(User).count()
-            queries = db.query(Query).count()
-            documents = db.query(Document).count()
-            
             # Get recent activity (last 24 hours)
-            from datetime import datetime, timedelta
             yesterday = datetime.utcnow() - timedelta(days=1)
             
-            recent_queries = db.query(Query).filter(
-                Query.created_at >= yesterday
-            ).count()
-            
-            # Get top active companies by query count
-            from sqlalchemy import func
-            top_companies = db.query(
-                Company.name,
-                func.count(Query.id).label('query_count')
-            ).join(Query).group_by(Company.id).order_by(
-                func.count(Query.id).desc()
-            ).limit(5).all()
+            counts = db.execute(INSIGHT_COUNTS, {"since": yesterday}).one()
+            top_companies = db.execute(TOP_ACTIVE_COMPANIES).all()
             
             return {
-                "total_companies": companies,
-                "total_users": users,
-                "total_queries": queries,
-                "total_documents": documents,
-                "recent_queries_24h": recent_queries,
+                "total_companies": counts.companies,
+                "total_users": counts.users,
+                "total_queries": counts.queries,
+                "total_documents": counts.documents,
+                "recent_queries_24h": counts.recent_queries,
                 "top_active_companies": [
                     {"name": name, "query_count": count} 
                     for name, count in top_companies
@@ -349,4 +666,4 @@ class ExcelIntegrationService:
             
         except Exception as e:
             self.logger.error(f"Error getting insights: {e}")
-            return {"error": str(e)}
\ No newline at end of file
+            return {"error": str(e)}
@@ -1,30 +1,95 @@
+import httpx
 import openai
+import orjson
 import os
-from typing import Dict, List
+import time
+import xxhash
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# HTTP/2 connection pool shared by every LLMService instance, so concurrent
+# requests multiplex over the same keep-alive TLS connections to OpenAI
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Create the shared OpenAI HTTP client on first use"""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=30.0,
+            limits=httpx.Limits(max_keepalive_connections=50, max_connections=200)
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Close the shared OpenAI HTTP client (called on app shutdown)"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+# Intent results are cached in process by normalized query text; repeated
+# queries are common, and the classification does not need to be fresh
+INTENT_CACHE_SIZE = 10_000
+INTENT_CACHE_TTL_SECONDS = 3600.0
+_intent_cache: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+
+
+def _intent_cache_key(query: str) -> str:
+    """Normalize the query so case and surrounding whitespace share an entry"""
+    return xxhash.xxh3_128_hexdigest(query.strip().lower())
+
+
+def _get_cached_intent(key: str) -> Optional[Dict]:
+    """Return a live cached intent and mark it recently used"""
+    entry = _intent_cache.get(key)
+    if entry is None:
+        return None
+    cached_at, intent = entry
+    if time.monotonic() - cached_at >= INTENT_CACHE_TTL_SECONDS:
+        del _intent_cache[key]
+        return None
+    _intent_cache.move_to_end(key)
+    return dict(intent)
+
+
+def _cache_intent(key: str, intent: Dict) -> None:
+    """Store an intent, evicting the least recently used entry when full"""
+    _intent_cache[key] = (time.monotonic(), intent)
+    _intent_cache.move_to_end(key)
+    if len(_intent_cache) > INTENT_CACHE_SIZE:
+        _intent_cache.popitem(last=False)
+
+
+# Shared by the JSON-mode and streamed answer prompts
+ANSWER_SYSTEM_PROMPT = """You are a helpful AI assistant that provides comprehensive, 
+            accurate answers to user queries. Focus on being informative and helpful.
+            If you don't have enough information, say so clearly."""
+
+# Attribution saved with generated answers
+ANSWER_SOURCES = ["OpenAI GPT-3.5"]
+ANSWER_CONFIDENCE = 0.85
+
+
 class LLMService:
     def __init__(self):
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable is not set")
         
-        # Initialize OpenAI client with modern API (1.x+)
+        # Initialize async OpenAI client with modern API (1.x+) so calls never
+        # block the event loop
         try:
-            # Clean initialization without any extra parameters that might cause proxy issues
-            import httpx
-            
-            # Create a custom HTTP client without proxy settings
-            http_client = httpx.Client(
-                timeout=30.0,
-                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
-            )
-            
-            self.client = openai.OpenAI(
+            self.client = openai.AsyncOpenAI(
                 api_key=api_key,
-                http_client=http_client
+                http_client=_get_http_client()
             )
             self._client_available = True
             print("✅ OpenAI client initialized successfully")
@@ -32,7 +97,7 @@ class LLMService:
             print(f"❌ Failed to initialize OpenAI client: {e}")
             # Try minimal initialization as fallback
             try:
-                self.client = openai.OpenAI(api_key=api_key)
+                self.client = openai.AsyncOpenAI(api_key=api_key)
                 self._client_available = True
                 print("✅ OpenAI client initialized with fallback method")
             except Exception as e2:
@@ -40,6 +105,19 @@ class LLMService:
                 self.client = None
                 self._client_available = False
     
+    def _answer_messages(self, query: str, context: Optional[List[str]], system_prompt: str) -> List[Dict[str, str]]:
+        """Chat messages for an answer request, with recent queries as context"""
+        # Build user message with context if provided
+        user_message = f"Query: {query}"
+        if context:
+            context_text = "\n".join(context[:3])  # Limit context to prevent token overflow
+            user_message = f"Context:\n{context_text}\n\nQuery: {query}"
+        
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ]
+    
     async def generate_answer(self, query: str, context: List[str] = None) -> Dict[str, any]:
         """
         Generate an answer using OpenAI GPT-3.5 based on the user query.
@@ -51,46 +129,29 @@ class LLMService:
             raise Exception("OpenAI service is currently unavailable. Please check your API key and internet connection.")
         
         try:
-            # Build system prompt
-            system_prompt = """You are a helpful AI assistant that provides comprehensive, 
-            accurate answers to user queries. Focus on being informative and helpful.
-            If you don't have enough information, say so clearly."""
-            
-            # Build user message with context if provided
-            user_message = f"Query: {query}"
-            if context:
-                context_text = "\n".join(context[:3])  # Limit context to prevent token overflow
-                user_message = f"Context:\n{context_text}\n\nQuery: {query}"
+            # Build system prompt; the title is requested in the same completion
+            # so the answer and title cost a single round trip
+            system_prompt = ANSWER_SYSTEM_PROMPT + """
+            Also write a concise, descriptive title for your answer in 5-8 words.
+            Return as JSON: {"title": "...", "answer": "..."}"""
             
             # Modern OpenAI API call (1.x+)
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message}
-                ],
-                max_tokens=1000,
+                messages=self._answer_messages(query, context, system_prompt),
+                response_format={"type": "json_object"},
+                max_tokens=1050,
                 temperature=0.7
             )
-            answer = response.choices[0].message.content
-            
-            # Generate a title for the document
-            title_response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "Generate a concise, descriptive title for this content in 5-8 words."},
-                    {"role": "user", "content": f"Content: {answer}"}
-                ],
-                max_tokens=50,
-                temperature=0.5
-            )
-            title = title_response.choices[0].message.content.strip().strip('"')
+            result = orjson.loads(response.choices[0].message.content)
+            answer = result["answer"]
+            title = str(result.get("title", "")).strip().strip('"')
             
             return {
                 "answer": answer,
                 "title": title,
-                "sources": ["OpenAI GPT-3.5"],
-                "confidence": 0.85,
+                "sources": ANSWER_SOURCES,
+                "confidence": ANSWER_CONFIDENCE,
                 "success": True
             }
             
@@ -98,6 +159,64 @@ class LLMService:
             print(f"❌ Error calling OpenAI API: {str(e)}")
             raise Exception(f"Failed to generate answer: {str(e)}")
     
+    async def generate_answer_stream(self, query: str, context: List[str] = None) -> AsyncIterator[str]:
+        """
+        Stream an answer from OpenAI GPT-3.5 as text chunks, as soon as they are generated.
+        Only the answer is streamed; JSON mode (and so the title) cannot be read incrementally.
+        Raises exception if OpenAI client is not available to prevent saving error documents.
+        """
+        # Check if OpenAI client is available
+        if not self._client_available or not self.client:
+            print(f"❌ OpenAI client not available, cannot process query: {query}")
+            raise Exception("OpenAI service is currently unavailable. Please check your API key and internet connection.")
+        
+        try:
+            stream = await self.client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=self._answer_messages(query, context, ANSWER_SYSTEM_PROMPT),
+                max_tokens=1050,
+                temperature=0.7,
+                stream=True
+            )
+            async for chunk in stream:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    yield text
+            
+        except Exception as e:
+            print(f"❌ Error calling OpenAI API: {str(e)}")
+            raise Exception(f"Failed to generate answer: {str(e)}")
+    
+    async def generate_title(self, query: str, answer: str) -> str:
+        """
+        Title an answer that was already generated, in JSON mode like the titles
+        from generate_answer. Streamed answers are plain text, so they are titled
+        once complete.
+        """
+        if not self._client_available or not self.client:
+            raise Exception("OpenAI service is currently unavailable. Please check your API key and internet connection.")
+        
+        try:
+            system_prompt = """Write a concise, descriptive title in 5-8 words for the answer
+            to the user's query. Return as JSON: {"title": "..."}"""
+            
+            response = await self.client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": f"Query: {query}\n\nAnswer: {answer}"}
+                ],
+                response_format={"type": "json_object"},
+                max_tokens=50,
+                temperature=0.3
+            )
+            result = orjson.loads(response.choices[0].message.content)
+            return str(result.get("title", "")).strip().strip('"')
+            
+        except Exception as e:
+            print(f"❌ Error generating title: {str(e)}")
+            raise Exception(f"Failed to generate title: {str(e)}")
+    
     async def detect_intent(self, query: str) -> Dict[str, any]:
         """
         Detect the intent and category of a user query for better recommendations.
@@ -109,6 +228,11 @@ class LLMService:
                 "confidence": 0.5
             }
             
+        cache_key = _intent_cache_key(query)
+        cached_intent = _get_cached_intent(cache_key)
+        if cached_intent is not None:
+            return cached_intent
+        
         try:
             system_prompt = """Analyze the user query and classify it into one of these categories:
             - informational: seeking knowledge or facts
@@ -120,19 +244,22 @@ class LLMService:
             Also extract 3-5 relevant keywords. Return as JSON:
             {"category": "...", "keywords": ["...", "..."], "confidence": 0.0-1.0}"""
             
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": query}
                 ],
+                # JSON mode constrains the reply to a parseable object
+                response_format={"type": "json_object"},
                 max_tokens=200,
                 temperature=0.3
             )
             
-            import json
-            result = json.loads(response.choices[0].message.content)
-            return result
+            result = orjson.loads(response.choices[0].message.content)
+            # Only model answers are cached; the keyword fallback below is cheap
+            _cache_intent(cache_key, result)
+            return dict(result)
             
         except Exception as e:
             print(f"Error detecting intent: {str(e)}")
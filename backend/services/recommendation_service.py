@@ -1,7 +1,13 @@
+import asyncio
+import math
+import re
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Dict, Tuple
+from functools import lru_cache
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer, TfidfVectorizer
+from typing import Any, List, Dict, Set, Tuple
+from datetime import datetime
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 from models.models import Document, Query, User
 from services.cache_service import CacheService
@@ -9,6 +15,109 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+
+# Stateless term hasher shared by every corpus: there is no vocabulary to fit
+# per request or to keep per company, only the IDF weights
+HASHING_VECTORIZER = HashingVectorizer(
+    n_features=2 ** 18,
+    stop_words='english',
+    ngram_range=(1, 3),  # Include trigrams for better phrase matching
+    alternate_sign=False,
+    norm=None
+)
+
+# Terms in more than this share of a company's documents carry no weight
+CORPUS_MAX_DF = 0.7
+
+# Less common sources get a small boost to encourage exploration
+DIVERSITY_BOOSTED_SOURCES = frozenset({"Research", "API", "Policy"})
+
+# Columns the recommender reads. Content is cut to the 300-character preview
+# plus one character, which is enough to tell whether the preview is truncated;
+# full bodies are only fetched when a corpus index has to be built
+RECOMMENDATION_COLUMNS = (
+    Document.id,
+    Document.title,
+    func.substr(Document.content, 1, 301).label("content"),
+    Document.source,
+    Document.confidence,
+    Document.created_at
+)
+
+# Preprocessed document texts remembered per process, so a corpus change only
+# preprocesses the documents that are new or edited
+PREPROCESSED_TEXT_CACHE_SIZE = 20_000
+
+# Source-based explanations (RAG-ready)
+SOURCE_EXPLANATIONS = {
+    "API": "API documentation",
+    "Guide": "Step-by-step guide", 
+    "Research": "Research insights",
+    "Wiki": "Knowledge base content",
+    "Policy": "Policy documentation"
+}
+
+# Text normalization applied to documents and queries before hashing
+SPECIAL_CHARACTERS_RE = re.compile(r'[^\w\s\-\.]')
+ABBREVIATIONS = {
+    'hr': 'human resources',
+    'gl': 'general ledger', 
+    'capex': 'capital expenditure',
+    'q1': 'quarter one', 'q2': 'quarter two', 'q3': 'quarter three', 'q4': 'quarter four'
+}
+# All abbreviations in one alternation so expansion is a single scan; no
+# expansion contains another abbreviation, so this matches sequential subs
+ABBREVIATIONS_RE = re.compile(r'\b(?:' + '|'.join(map(re.escape, ABBREVIATIONS)) + r')\b')
+
+
+def _corpus_version(documents: List[Document], generation: int) -> str:
+    """
+    Identify a company's document set. Inserts and deletes change the count,
+    highest id or newest timestamp; in-place edits bump the generation. A
+    fitted corpus index is rebuilt only when the documents actually change.
+    """
+    created = [doc.created_at for doc in documents if doc.created_at]
+    newest = max(created).timestamp() if created else 0
+    return f"{len(documents)}-{max(doc.id for doc in documents)}-{newest:.6f}-{generation}"
+
+
+def _top_k_indices(scores: np.ndarray, candidates: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest-scoring candidates, best first. Selection is a
+    linear-time partition; only the survivors are sorted, ties in index order.
+    """
+    if k <= 0:
+        return candidates[:0]
+    if len(candidates) > k:
+        kth_score = np.partition(scores[candidates], -k)[-k]
+        candidates = candidates[scores[candidates] >= kth_score]
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order][:k]
+
+
+def _weight_query_terms(idf: np.ndarray, processed_query: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hashed term ids and TF-IDF weights of a query, computed the way the corpus
+    transformer weights documents (log-scaled term frequency, IDF, L2 norm)
+    but on the query's few terms only, instead of multiplying by sklearn's
+    2**18-wide IDF diagonal on every request
+    """
+    term_counts = HASHING_VECTORIZER.transform([processed_query])
+    weights = (np.log(term_counts.data) + 1) * idf[term_counts.indices]
+    norm = np.sqrt(np.dot(weights, weights))
+    if norm > 0:
+        weights /= norm
+    return term_counts.indices, weights.astype(np.float32)
+
+
+def _new_tfidf_transformer() -> TfidfTransformer:
+    """
+    Log-scaled term frequencies and L2-normalized rows, so cosine similarity
+    is a plain dot product
+    """
+    return TfidfTransformer(sublinear_tf=True, smooth_idf=True, norm='l2')
+
+
 class RecommendationService:
     def __init__(self, cache_service: CacheService):
         self.cache_service = cache_service
@@ -17,6 +126,14 @@ class RecommendationService:
             stop_words='english',
             ngram_range=(1, 2)
         )
+        # company_id -> (corpus version, IDF weights, column-major document TF-IDF matrix,
+        # term index); an in-process layer in front of the TF-IDF copy shared through Redis
+        self._corpus_indexes: Dict[int, Tuple[str, np.ndarray, Any, Dict[str, Any]]] = {}
+        # Document text -> preprocessed text; document text only changes through an edit,
+        # which yields a new key
+        self._preprocess_document = lru_cache(maxsize=PREPROCESSED_TEXT_CACHE_SIZE)(
+            self._preprocess_text_intelligently
+        )
     
     async def get_recommendations(
         self, 
@@ -32,42 +149,102 @@ class RecommendationService:
         cached_recommendations = await self.cache_service.get_recommendations(user_id)
         if cached_recommendations:
             logger.info(f"Returning cached recommendations for user {user_id}")
-            return cached_recommendations
+            return await self._hydrate_recommendations(cached_recommendations, db)
         
-        # Get user's query history
-        user_queries = db.query(Query).filter(
-            Query.user_id == user_id,
-            Query.company_id == company_id
-        ).order_by(Query.created_at.desc()).limit(10).all()
+        # Get user's query history and all company documents; the session is
+        # synchronous, so both reads run in one worker thread
+        loop = asyncio.get_running_loop()
+        user_queries, company_documents = await loop.run_in_executor(
+            None, self._load_recommendation_inputs, user_id, company_id, db
+        )
         
         if not user_queries:
             # New user - return company-level popular documents with lower baseline scores
             logger.info(f"New user {user_id} - providing fallback recommendations")
             return await self._get_company_fallback_recommendations(company_id, db, limit)
         
-        # Get all company documents
-        company_documents = db.query(Document).filter(
-            Document.company_id == company_id
-        ).order_by(Document.created_at.desc()).all()
-        
         if not company_documents:
             return []
         
         # Calculate recommendations using TF-IDF similarity
         recommendations = await self._calculate_similarity_recommendations(
-            user_queries, company_documents, limit
+            user_queries, company_documents, limit, company_id, db
         )
         
-        # Cache the recommendations
-        await self.cache_service.cache_recommendations(user_id, recommendations)
+        # Cache the recommendations; only ids, scores and explanations are stored
+        # and the document fields are re-read on a hit
+        await self.cache_service.cache_recommendations(user_id, [
+            {"id": rec["id"], "relevance_score": rec["relevance_score"], "explanation": rec["explanation"]}
+            for rec in recommendations
+        ])
         
         return recommendations
     
+    async def _hydrate_recommendations(self, cached_recommendations: List[Dict], db: Session) -> List[Dict]:
+        """
+        Rebuild cached recommendations from their ids, scores and explanations
+        with one primary-key lookup. Documents deleted since are dropped and
+        edits show up without waiting for the cache to expire.
+        """
+        stmt = select(*RECOMMENDATION_COLUMNS).where(
+            Document.id.in_([rec["id"] for rec in cached_recommendations])
+        )
+        loop = asyncio.get_running_loop()
+        rows = await loop.run_in_executor(None, lambda: db.execute(stmt).all())
+        documents = {doc.id: doc for doc in rows}
+        
+        return [
+            self._to_recommendation(documents[rec["id"]], rec["relevance_score"], rec["explanation"])
+            for rec in cached_recommendations
+            if rec["id"] in documents
+        ]
+    
+    def _to_recommendation(self, doc: Document, relevance_score: float, explanation: str) -> Dict:
+        """Response dict for a document row, with the content cut to a 300-character preview"""
+        return {
+            "id": doc.id,
+            "title": doc.title,
+            "content": doc.content[:300] + "..." if len(doc.content) > 300 else doc.content,
+            "source": doc.source,
+            "confidence": doc.confidence,
+            "relevance_score": relevance_score,
+            "explanation": explanation,
+            "created_at": doc.created_at.isoformat()
+        }
+    
+    def _load_recommendation_inputs(
+        self, 
+        user_id: int, 
+        company_id: int, 
+        db: Session
+    ) -> Tuple[List[Query], List[Document]]:
+        """
+        The user's 10 most recent queries and the company's document rows,
+        newest first. Documents are skipped for users without queries.
+        """
+        user_queries = db.query(Query).filter(
+            Query.user_id == user_id,
+            Query.company_id == company_id
+        ).order_by(Query.created_at.desc()).limit(10).all()
+        
+        if not user_queries:
+            return user_queries, []
+        
+        company_documents = db.execute(
+            select(*RECOMMENDATION_COLUMNS).where(
+                Document.company_id == company_id
+            ).order_by(Document.created_at.desc(), Document.id.desc())
+        ).all()
+        
+        return user_queries, company_documents
+    
     async def _calculate_similarity_recommendations(
         self,
         user_queries: List[Query],
         documents: List[Document],
-        limit: int
+        limit: int,
+        company_id: int = None,
+        db: Session = None
     ) -> List[Dict]:
         """
         INTELLIGENT DYNAMIC RECOMMENDATION ALGORITHM
@@ -79,260 +256,358 @@ class RecommendationService:
             if not user_queries:
                 return []
             
-            # STEP 1: DYNAMIC QUERY PROCESSING with intelligent recency weighting
-            query_texts = [query.query_text for query in user_queries]
-            
-            # Exponential decay for query importance (most recent = highest weight)
-            weighted_queries = []
-            for i, query_text in enumerate(query_texts):
-                # Exponential decay: weight = e^(-0.5*i)
-                # Recent: 1.0, Second: 0.6, Third: 0.37, Fourth: 0.22, etc.
-                import math
-                weight = math.exp(-0.5 * i)
-                repetitions = max(1, int(weight * 10))  # Scale to reasonable repetitions
-                weighted_queries.extend([query_text] * repetitions)
-            
-            query_combined = " ".join(weighted_queries)
+            corpus_index = await self._get_corpus_index(company_id, documents, db)
             
-            # STEP 2: ADVANCED SEMANTIC PREPROCESSING
-            processed_queries = self._preprocess_text_intelligently(query_combined)
-            processed_docs = [self._preprocess_text_intelligently(f"{doc.title} {doc.content}") 
-                            for doc in documents]
-            
-            # STEP 3: INTELLIGENT TF-IDF with enhanced parameters
-            all_texts = [processed_queries] + processed_docs
-            
-            # Enhanced TF-IDF vectorizer for better semantic understanding
-            tfidf_vectorizer = TfidfVectorizer(
-                stop_words='english',
-                max_features=10000,  # Increased for better vocabulary coverage
-                ngram_range=(1, 3),  # Include trigrams for better phrase matching
-                min_df=1,
-                max_df=0.7,  # Lower to avoid common words
-                sublinear_tf=True,  # Use log-scaled term frequencies
-                use_idf=True,
-                smooth_idf=True,
-                norm='l2'  # L2 normalization for better cosine similarity
+            # Scoring is CPU-bound; keep it off the event loop
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                None, self._score_documents, user_queries, documents, limit, corpus_index
             )
             
-            tfidf_matrix = tfidf_vectorizer.fit_transform(all_texts)
-            query_vector = tfidf_matrix[0:1]
-            doc_vectors = tfidf_matrix[1:]
-            
-            # Base cosine similarity scores
-            base_similarities = cosine_similarity(query_vector, doc_vectors)[0]
-            
-            # STEP 4: INTELLIGENT SEMANTIC BOOSTING (No hardcoded categories!)
-            enhanced_similarities = []
-            most_recent_query = user_queries[0].query_text.lower()
-            
-            for i, (doc, base_sim) in enumerate(zip(documents, base_similarities)):
-                enhanced_score = base_sim
-                
-                # DYNAMIC TITLE RELEVANCE BOOST
-                title_relevance = self._calculate_title_relevance(most_recent_query, doc.title)
-                enhanced_score += title_relevance
-                
-                # SEMANTIC KEYWORD DENSITY BOOST  
-                keyword_density = self._calculate_semantic_keyword_density(most_recent_query, doc)
-                enhanced_score += keyword_density
-                
-                # CONTENT FRESHNESS & CONFIDENCE BOOST
-                confidence_boost = self._calculate_confidence_boost(doc)
-                enhanced_score += confidence_boost
-                
-                # QUERY-DOCUMENT SEMANTIC ALIGNMENT
-                semantic_alignment = self._calculate_semantic_alignment(user_queries, doc)
-                enhanced_score += semantic_alignment
-                
-                enhanced_similarities.append(enhanced_score)
-                
-                # Debug logging for transparency
-                if title_relevance > 0 or keyword_density > 0.1 or semantic_alignment > 0.1:
-                    print(f"🧠 SMART BOOST: '{doc.title[:50]}...' - Title:{title_relevance:.3f}, Keywords:{keyword_density:.3f}, Alignment:{semantic_alignment:.3f}")
-            
-            similarities = enhanced_similarities
-            
-            # Create recommendations with scores
-            recommendations = []
-            for i, (doc, similarity_score) in enumerate(zip(documents, similarities)):
-                # Lower threshold to 0.01 to allow more diverse cross-intent recommendations
-                # Even documents with low similarity should be shown to promote discovery
-                if similarity_score > 0.01:  
-                    explanation = self._generate_explanation(
-                        similarity_score, 
-                        user_queries[-3:],  # Use last 3 queries for explanation
-                        doc
-                    )
-                    
-                    # Apply diversity boost for source variety and quality
-                    final_score = self._apply_diversity_boost(
-                        similarity_score, 
-                        doc, 
-                        user_queries[0].user_id if user_queries else None
-                    )
-                    
-                    recommendations.append({
-                        "id": doc.id,
-                        "title": doc.title,
-                        "content": doc.content[:300] + "..." if len(doc.content) > 300 else doc.content,
-                        "source": doc.source,
-                        "confidence": doc.confidence,
-                        "relevance_score": float(final_score),
-                        "explanation": explanation,
-                        "created_at": doc.created_at.isoformat()
-                    })
-            
-            # Ensure source diversity: guarantee representation from different document types
-            recommendations = self._ensure_source_diversity(recommendations, documents, user_queries[0].user_id if user_queries else None)
-            
-            # Sort by relevance score and return top N
-            recommendations.sort(key=lambda x: x["relevance_score"], reverse=True)
-            return recommendations[:limit]
-            
         except Exception as e:
             logger.error(f"Error calculating similarity recommendations: {str(e)}")
             return []
     
-    def _preprocess_text_intelligently(self, text: str) -> str:
+    def _score_documents(
+        self,
+        user_queries: List[Query],
+        documents: List[Document],
+        limit: int,
+        corpus_index: Tuple[np.ndarray, Any, Dict[str, Any]]
+    ) -> List[Dict]:
         """
-        Intelligent text preprocessing for better semantic understanding
+        Score every document against the user's queries and return the top
+        recommendations, using the company's corpus index
         """
-        import re
-        
-        # Convert to lowercase
-        text = text.lower()
+        # STEP 1: DYNAMIC QUERY PROCESSING with intelligent recency weighting
+        query_texts = [query.query_text for query in user_queries]
+        
+        # Exponential decay for query importance (most recent = highest weight)
+        weighted_queries = []
+        for i, query_text in enumerate(query_texts):
+            # Exponential decay: weight = e^(-0.5*i)
+            # Recent: 1.0, Second: 0.6, Third: 0.37, Fourth: 0.22, etc.
+            weight = math.exp(-0.5 * i)
+            repetitions = max(1, int(weight * 10))  # Scale to reasonable repetitions
+            weighted_queries.extend([query_text] * repetitions)
+        
+        query_combined = " ".join(weighted_queries)
+        
+        # STEP 2: ADVANCED SEMANTIC PREPROCESSING
+        processed_queries = self._preprocess_text_intelligently(query_combined)
+        
+        # STEP 3: INTELLIGENT TF-IDF over the precomputed document index;
+        # only the query is transformed per request
+        idf, doc_vectors, term_index = corpus_index
+        query_terms, query_weights = _weight_query_terms(idf, processed_queries)
+        
+        # Base cosine similarity scores: both sides are already L2-normalized, so
+        # this is a dot product over the postings of the query's terms alone
+        base_similarities = doc_vectors[:, query_terms] @ query_weights
+        
+        # STEP 4: INTELLIGENT SEMANTIC BOOSTING (No hardcoded categories!)
+        # Title relevance, keyword density and query-document alignment for
+        # every document at once, plus the precomputed confidence boosts
+        title_relevance, keyword_density, semantic_alignment = self._calculate_semantic_boosts(
+            term_index, user_queries
+        )
+        enhanced_similarities = (
+            base_similarities
+            + title_relevance
+            + keyword_density
+            + term_index["confidence_boosts"]
+            + semantic_alignment
+        )
         
-        # Remove special characters but keep important punctuation
-        text = re.sub(r'[^\w\s\-\.]', ' ', text)
+        # Debug logging for transparency; skipped entirely unless DEBUG is enabled
+        if logger.isEnabledFor(logging.DEBUG):
+            boosted = (title_relevance > 0) | (keyword_density > 0.1) | (semantic_alignment > 0.1)
+            for i in np.flatnonzero(boosted):
+                logger.debug(
+                    "🧠 SMART BOOST: '%s...' - Title:%.3f, Keywords:%.3f, Alignment:%.3f",
+                    documents[i].title[:50], title_relevance[i], keyword_density[i], semantic_alignment[i]
+                )
+        
+        similarities = enhanced_similarities
+        final_scores = self._apply_diversity_boost(similarities, term_index)
+        
+        # Lower threshold to 0.01 to allow more diverse cross-intent recommendations
+        # Even documents with low similarity should be shown to promote discovery
+        eligible = np.flatnonzero(similarities > 0.01)
+        
+        # Materialize recommendations only for the documents that can make the cut;
+        # the explanation topics come from the queries alone, so extract them once
+        query_topics = self._extract_query_topics(user_queries[-3:])  # Use last 3 queries for explanation
+        recommendations = []
+        for i in _top_k_indices(final_scores, eligible, limit):
+            doc = documents[i]
+            explanation = self._generate_explanation(similarities[i], query_topics, doc)
+            
+            recommendations.append(self._to_recommendation(doc, float(final_scores[i]), explanation))
         
-        # Handle common abbreviations and expand them
-        abbreviations = {
-            'hr': 'human resources',
-            'gl': 'general ledger', 
-            'capex': 'capital expenditure',
-            'q1': 'quarter one', 'q2': 'quarter two', 'q3': 'quarter three', 'q4': 'quarter four'
-        }
+        # Ensure source diversity: guarantee representation from different document types
+        sources = term_index["sources"]
+        covered_sources = {sources[code] for code in np.unique(term_index["source_codes"][eligible])}
+        recommendations = self._ensure_source_diversity(recommendations, documents, term_index, covered_sources)
         
-        for abbr, full in abbreviations.items():
-            text = re.sub(r'\b' + abbr + r'\b', full, text)
+        # Sort by relevance score and return top N
+        recommendations.sort(key=lambda x: x["relevance_score"], reverse=True)
+        return recommendations[:limit]
+    
+    async def _get_corpus_index(
+        self, 
+        company_id: int, 
+        documents: List[Document], 
+        db: Session = None
+    ) -> Tuple[np.ndarray, Any, Dict[str, Any]]:
+        """
+        Return the IDF weights, document TF-IDF matrix and term index for
+        a company's corpus. The TF-IDF lookup order is this process, then Redis
+        (shared by every worker), then a fresh fit that is written back to
+        both; entries are reused until the corpus version changes.
+        """
+        loop = asyncio.get_running_loop()
+        stored = None
+        if company_id is not None:
+            generation = await self.cache_service.get_corpus_generation(company_id)
+            # Fingerprinting reads every row, so it runs in a worker thread too
+            version = await loop.run_in_executor(None, _corpus_version, documents, generation)
+            cached = self._corpus_indexes.get(company_id)
+            if cached and cached[0] == version:
+                return cached[1], cached[2], cached[3]
+            stored = await self.cache_service.get_corpus_tfidf(company_id, version)
+        
+        # Reading bodies and fitting are blocking; run them in a worker thread
+        idf, doc_vectors, term_index = await loop.run_in_executor(
+            None, self._build_indexes, company_id, documents, db, stored
+        )
         
-        # Remove extra whitespace
-        text = ' '.join(text.split())
+        if stored is None and company_id is not None:
+            await self.cache_service.cache_corpus_tfidf(company_id, version, idf, doc_vectors)
         
-        return text
+        # Requests read the document matrix by query-term columns
+        doc_vectors = doc_vectors.tocsc()
+        if company_id is not None:
+            self._corpus_indexes[company_id] = (version, idf, doc_vectors, term_index)
+        return idf, doc_vectors, term_index
     
-    def _calculate_title_relevance(self, query: str, title: str) -> float:
+    def _build_indexes(
+        self, 
+        company_id: int, 
+        documents: List[Document], 
+        db: Session, 
+        stored: Tuple[np.ndarray, Any] = None
+    ) -> Tuple[np.ndarray, Any, Dict[str, Any]]:
         """
-        Dynamic title relevance calculation without hardcoded categories
+        Build the term index, and the TF-IDF index unless a cached
+        (idf, document matrix) pair is given
         """
-        query_words = set(query.lower().split())
-        title_words = set(title.lower().split())
+        # Each document's text is lowercased once, for both indexes
+        contents = self._load_document_contents(db, company_id, documents)
+        texts = [f"{doc.title} {content}".lower() for doc, content in zip(documents, contents)]
         
-        # Calculate word overlap ratio
-        overlap = len(query_words.intersection(title_words))
-        total_query_words = len(query_words)
+        idf, doc_vectors = stored if stored is not None else self._build_corpus_index(texts)
         
-        if total_query_words == 0:
-            return 0.0
+        return idf, doc_vectors, self._build_term_index(texts, documents, contents)
+    
+    def _load_document_contents(self, db: Session, company_id: int, documents: List[Document]) -> List[str]:
+        """
+        Full content of each document, in order. Recommendation rows only
+        carry a preview, so the bodies are read just for building an index.
+        """
+        if db is None or company_id is None:
+            return [doc.content for doc in documents]
         
-        # Higher boost for higher overlap percentage
-        overlap_ratio = overlap / total_query_words
-        title_boost = overlap_ratio * 0.8  # Max 0.8 boost for perfect title match
+        contents = dict(db.execute(
+            select(Document.id, Document.content).where(Document.company_id == company_id)
+        ).all())
+        return [contents.get(doc.id, doc.content) for doc in documents]
+    
+    def _build_corpus_index(self, texts: List[str]) -> Tuple[np.ndarray, Any]:
+        """
+        Fit a corpus index over the lowercased document texts. Terms are
+        hashed, so only the IDF weights are fitted, on the documents alone.
+        """
+        processed_docs = [self._preprocess_document(text) for text in texts]
+        term_counts = HASHING_VECTORIZER.transform(processed_docs)
+        
+        tfidf_transformer = _new_tfidf_transformer()
+        tfidf_transformer.fit(term_counts)
+        
+        # Zero the IDF of terms that are too common to discriminate, unless that
+        # would drop every term (tiny corpora)
+        document_frequency = np.bincount(term_counts.indices, minlength=term_counts.shape[1])
+        too_common = document_frequency > CORPUS_MAX_DF * len(texts)
+        if np.count_nonzero(too_common) < np.count_nonzero(document_frequency):
+            idf = tfidf_transformer.idf_.copy()
+            idf[too_common] = 0.0
+            tfidf_transformer.idf_ = idf
+        
+        # Weights are kept at the half precision they are cached at, so a fresh
+        # fit and a copy loaded from Redis score identically
+        doc_vectors = tfidf_transformer.transform(term_counts)
+        doc_vectors.data = doc_vectors.data.astype(np.float16).astype(np.float32)
+        
+        return tfidf_transformer.idf_, doc_vectors
+    
+    def _build_term_index(self, texts: List[str], documents: List[Document], contents: List[str]) -> Dict[str, Any]:
+        """
+        Whitespace-token counts behind the semantic boosts, one column per
+        lowercased token, built in a single split of each document text: the
+        title's tokens are the leading tokens of "title content". Matrices are
+        stored column-major so a request only reads the postings of its own
+        query tokens.
+        """
+        vocabulary: Dict[str, int] = {}
+        doc_columns, doc_indptr = [], [0]
+        title_columns, title_indptr = [], [0]
+        for text, doc in zip(texts, documents):
+            columns = [vocabulary.setdefault(token, len(vocabulary)) for token in text.split()]
+            doc_columns.extend(columns)
+            doc_indptr.append(len(doc_columns))
+            # Lowercasing never adds or removes whitespace, so the title token count carries over
+            title_columns.extend(set(columns[:len(doc.title.split())]))
+            title_indptr.append(len(title_columns))
+        
+        shape = (len(texts), len(vocabulary))
+        doc_terms = sparse.csr_matrix(
+            (np.ones(len(doc_columns)), doc_columns, doc_indptr), shape=shape
+        )
+        doc_lengths = np.diff(doc_terms.indptr)
+        doc_terms.sum_duplicates()
+        title_terms = sparse.csr_matrix(
+            (np.ones(len(title_columns)), title_columns, title_indptr), shape=shape
+        )
         
-        return title_boost
+        return {
+            "vocabulary": vocabulary,
+            "title_terms": title_terms.tocsc(),
+            "doc_terms": doc_terms.tocsc(),
+            "doc_lengths": doc_lengths,
+            "distinct_terms": np.diff(doc_terms.indptr),
+            "confidence_boosts": self._calculate_confidence_boost(documents, contents),
+            **self._build_diversity_features(documents)
+        }
     
-    def _calculate_semantic_keyword_density(self, query: str, document: Document) -> float:
+    def _build_diversity_features(self, documents: List[Document]) -> Dict[str, Any]:
+        """
+        Per-document inputs of the diversity boost and source coverage. They
+        depend only on the corpus, so requests reuse them instead of reading
+        every document row again.
         """
-        Calculate keyword density in document content
+        source_codes: Dict[str, int] = {}
+        # Highest quality document of each source type in the company:
+        # by confidence/quality, then by recency
+        best_by_source: Dict[str, Tuple[Tuple, int]] = {}
+        for i, doc in enumerate(documents):
+            source_codes.setdefault(doc.source, len(source_codes))
+            quality = (doc.confidence or 0.5, doc.created_at)
+            best = best_by_source.get(doc.source)
+            if best is None or quality > best[0]:
+                best_by_source[doc.source] = (quality, i)
+        
+        return {
+            "sources": list(source_codes),
+            "source_codes": np.array([source_codes[doc.source] for doc in documents], dtype=np.intp),
+            "best_by_source": {source: best[1] for source, best in best_by_source.items()},
+            "boosted_sources": np.array([doc.source in DIVERSITY_BOOSTED_SOURCES for doc in documents], dtype=bool),
+            "created_at": np.array([doc.created_at for doc in documents], dtype="datetime64[us]"),
+            "confidence": np.array([doc.confidence or 0.0 for doc in documents], dtype=float)
+        }
+    
+    def _preprocess_text_intelligently(self, text: str) -> str:
         """
-        query_words = set(query.lower().split())
-        doc_content = f"{document.title} {document.content}".lower()
-        doc_words = doc_content.split()
+        Intelligent text preprocessing for better semantic understanding
+        """
+        # Convert to lowercase
+        text = text.lower()
         
-        if not doc_words:
-            return 0.0
+        # Remove special characters but keep important punctuation
+        text = SPECIAL_CHARACTERS_RE.sub(' ', text)
         
-        # Count keyword occurrences in document
-        keyword_count = sum(1 for word in doc_words if word in query_words)
-        density = keyword_count / len(doc_words)
+        # Handle common abbreviations and expand them
+        text = ABBREVIATIONS_RE.sub(lambda match: ABBREVIATIONS[match.group(0)], text)
         
-        # Scale density to reasonable boost range
-        density_boost = min(0.5, density * 10)  # Max 0.5 boost
+        # Remove extra whitespace
+        text = ' '.join(text.split())
         
-        return density_boost
+        return text
     
-    def _calculate_confidence_boost(self, document: Document) -> float:
+    def _calculate_semantic_boosts(
+        self, 
+        term_index: Dict[str, Any], 
+        user_queries: List[Query]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Dynamic title relevance, keyword density and semantic alignment boosts
+        for every document, without hardcoded categories. Returns one array
+        per boost.
+        """
+        vocabulary = term_index["vocabulary"]
+        document_count = term_index["doc_terms"].shape[0]
+        
+        # Word overlap of the most recent query with each title
+        query_words = set(user_queries[0].query_text.lower().split())
+        query_columns = [vocabulary[word] for word in query_words if word in vocabulary]
+        title_boosts = np.zeros(document_count)
+        if query_words:
+            overlap = term_index["title_terms"][:, query_columns].getnnz(axis=1)
+            # Higher boost for higher overlap percentage
+            title_boosts = overlap / len(query_words) * 0.8  # Max 0.8 boost for perfect title match
+        
+        # Share of document words that are query keywords, scaled to a reasonable boost range
+        keyword_count = np.asarray(term_index["doc_terms"][:, query_columns].sum(axis=1)).ravel()
+        doc_lengths = term_index["doc_lengths"]
+        density = np.divide(keyword_count, doc_lengths, out=np.zeros(document_count), where=doc_lengths > 0)
+        density_boosts = np.minimum(0.5, density * 10)  # Max 0.5 boost
+        
+        # Jaccard similarity of the recent 3 queries' words and each document's words
+        all_query_words = set(" ".join([q.query_text.lower() for q in user_queries[:3]]).split())
+        all_query_columns = [vocabulary[word] for word in all_query_words if word in vocabulary]
+        intersection = term_index["doc_terms"][:, all_query_columns].getnnz(axis=1)
+        union = len(all_query_words) + term_index["distinct_terms"] - intersection
+        jaccard_similarity = np.divide(intersection, union, out=np.zeros(document_count), where=union > 0)
+        alignment_boosts = jaccard_similarity * 0.3  # Max 0.3 boost
+        
+        return title_boosts, density_boosts, alignment_boosts
+    
+    def _calculate_confidence_boost(self, documents: List[Document], contents: List[str]) -> np.ndarray:
         """
         Boost based on document confidence and quality indicators
         """
-        confidence_boost = 0.0
-        
         # Use document confidence if available
-        if hasattr(document, 'confidence') and document.confidence:
-            confidence_boost += (document.confidence - 0.5) * 0.2  # Scale confidence
+        confidence = np.array([doc.confidence or 0.0 for doc in documents], dtype=float)
+        confidence_boosts = np.where(confidence != 0.0, (confidence - 0.5) * 0.2, 0.0)  # Scale confidence
         
         # Boost for longer, more detailed content
-        content_length = len(document.content)
-        if content_length > 200:
-            length_boost = min(0.1, content_length / 2000)  # Max 0.1 boost
-            confidence_boost += length_boost
+        content_length = np.array([len(content) for content in contents])
+        detailed = content_length > 200
+        confidence_boosts[detailed] += np.minimum(0.1, content_length[detailed] / 2000)  # Max 0.1 boost
         
-        return max(0.0, confidence_boost)
+        return np.maximum(0.0, confidence_boosts)
     
-    def _calculate_semantic_alignment(self, user_queries: List[Query], document: Document) -> float:
+    def _extract_query_topics(self, recent_queries: List[Query]) -> List[str]:
         """
-        Calculate how well document aligns with user's query patterns
+        Key terms of the recent queries, quoted by explanations
         """
-        if not user_queries:
-            return 0.0
-        
-        # Analyze query patterns
-        all_query_text = " ".join([q.query_text.lower() for q in user_queries[:3]])  # Recent 3 queries
-        doc_content = f"{document.title} {document.content}".lower()
-        
-        # Simple semantic alignment based on word co-occurrence
-        query_words = set(all_query_text.split())
-        doc_words = set(doc_content.split())
-        
-        # Calculate Jaccard similarity
-        intersection = len(query_words.intersection(doc_words))
-        union = len(query_words.union(doc_words))
-        
-        if union == 0:
-            return 0.0
-        
-        jaccard_similarity = intersection / union
-        alignment_boost = jaccard_similarity * 0.3  # Max 0.3 boost
-        
-        return alignment_boost
+        query_topics = []
+        for query in recent_queries:
+            # Extract key terms (simple approach - could be enhanced)
+            words = query.query_text.lower().split()
+            key_words = [w for w in words if len(w) > 4][:2]
+            query_topics.extend(key_words)
+        return query_topics
     
     def _generate_explanation(
         self, 
         similarity_score: float, 
-        recent_queries: List[Query], 
+        query_topics: List[str], 
         document: Document
     ) -> str:
         """
         Generate RAG-ready explanations based on content relevance and source type.
         """
-        query_topics = []
-        for query in recent_queries:
-            # Extract key terms (simple approach - could be enhanced)
-            words = query.query_text.lower().split()
-            key_words = [w for w in words if len(w) > 4][:2]
-            query_topics.extend(key_words)
-        
-        # Source-based explanations (RAG-ready)
-        source_explanations = {
-            "API": "API documentation",
-            "Guide": "Step-by-step guide", 
-            "Research": "Research insights",
-            "Wiki": "Knowledge base content",
-            "Policy": "Policy documentation"
-        }
-        
-        source_context = source_explanations.get(document.source, "Documentation")
+        source_context = SOURCE_EXPLANATIONS.get(document.source, "Documentation")
         
         if similarity_score > 0.4:
             if query_topics:
@@ -349,81 +624,65 @@ class RecommendationService:
     
     def _apply_diversity_boost(
         self, 
-        similarity_score: float, 
-        document: Document, 
-        current_user_id: int = None
-    ) -> float:
+        similarities: np.ndarray, 
+        term_index: Dict[str, Any]
+    ) -> np.ndarray:
         """
-        Apply diversity boost for RAG-ready document discovery.
+        Apply diversity boost for RAG-ready document discovery, for all documents at once.
         Promotes source diversity and recency without relying on user authorship.
         """
-        base_score = similarity_score
+        base_scores = similarities.astype(float)
         
         # Source diversity boost (simulate different document sources)
         # In real RAG: GitHub vs Confluence vs Support tickets
-        source_types = ["Guide", "Research", "Wiki", "API", "Policy"]
-        if document.source in source_types:
-            # Boost non-standard sources to encourage exploration
-            if document.source not in ["Guide", "Wiki"]:  # Boost less common sources
-                source_diversity_boost = 0.03
-                base_score += source_diversity_boost
+        # Boost less common sources to encourage exploration
+        base_scores[term_index["boosted_sources"]] += 0.03
         
         # Boost for recent documents (recency matters in RAG)
-        from datetime import datetime, timedelta
-        if document.created_at and isinstance(document.created_at, datetime):
-            days_old = (datetime.utcnow() - document.created_at).days
-            if days_old <= 7:  # Recent documents get boost
-                recency_boost = 0.02 * (7 - days_old) / 7
-                base_score += recency_boost
+        created_at = term_index["created_at"]
+        dated = np.flatnonzero(~np.isnat(created_at))
+        days_old = (np.datetime64(datetime.utcnow(), "us") - created_at[dated]) // np.timedelta64(1, "D")
+        recent = days_old <= 7  # Recent documents get boost
+        base_scores[dated[recent]] += 0.02 * (7 - days_old[recent]) / 7
         
         # Document quality/confidence boost (simulates RAG document quality scores)
-        if hasattr(document, 'confidence') and document.confidence:
-            quality_boost = (document.confidence - 0.5) * 0.05  # Boost high-confidence docs
-            base_score += max(0, quality_boost)
+        confidence = term_index["confidence"]
+        rated = confidence != 0.0
+        base_scores[rated] += np.maximum(0, (confidence[rated] - 0.5) * 0.05)
         
         # Cap the maximum score to 1.0
-        return min(base_score, 1.0)
+        return np.minimum(base_scores, 1.0)
     
     def _ensure_source_diversity(
         self, 
         recommendations: List[Dict], 
         all_documents: List[Document], 
-        current_user_id: int = None
+        term_index: Dict[str, Any],
+        covered_sources: Set[str]
     ) -> List[Dict]:
         """
         Ensure source type diversity in recommendations for RAG integration.
         Promotes discovery across different document types (APIs, guides, policies, etc.)
+        covered_sources are the sources of every document that scored above the
+        recommendation threshold, not only of the top-scoring ones materialized.
         """
-        # Get all unique source types in current recommendations
-        rec_sources = {rec["source"] for rec in recommendations}
-        
-        # Get all available source types in the company
-        all_sources = {doc.source for doc in all_documents}
-        missing_sources = all_sources - rec_sources
+        # Best document of each source type, picked when the corpus was indexed
+        best_by_source = term_index["best_by_source"]
+        rec_ids = {rec["id"] for rec in recommendations}
         
         # Add one document from each missing source type
-        for source_type in missing_sources:
-            # Find the highest quality document from this source
-            source_docs = [doc for doc in all_documents if doc.source == source_type]
-            if source_docs:
-                # Sort by confidence/quality, then by recency
-                best_doc = max(source_docs, key=lambda d: (d.confidence or 0.5, d.created_at))
-                
+        for source_type in best_by_source.keys() - covered_sources:
+            best_doc = all_documents[best_by_source[source_type]]
+            
+            # Only add if not already in recommendations
+            if best_doc.id not in rec_ids:
                 # Add with source diversity score
-                diversity_rec = {
-                    "id": best_doc.id,
-                    "title": best_doc.title,
-                    "content": best_doc.content[:300] + "..." if len(best_doc.content) > 300 else best_doc.content,
-                    "source": best_doc.source,
-                    "confidence": best_doc.confidence,
-                    "relevance_score": 0.06,  # Low but visible score for source diversity
-                    "explanation": f"Knowledge from {source_type} - exploring different content types.",
-                    "created_at": best_doc.created_at.isoformat()
-                }
-                
-                # Only add if not already in recommendations
-                if not any(rec["id"] == best_doc.id for rec in recommendations):
-                    recommendations.append(diversity_rec)
+                diversity_rec = self._to_recommendation(
+                    best_doc,
+                    0.06,  # Low but visible score for source diversity
+                    f"Knowledge from {source_type} - exploring different content types."
+                )
+                recommendations.append(diversity_rec)
         
         return recommendations
     
@@ -438,10 +697,12 @@ class RecommendationService:
         Uses lower baseline scores to ensure users with query history rank higher.
         """
         try:
-            # Get most recent documents from the company
-            company_documents = db.query(Document).filter(
+            # Get most recent documents from the company, off the event loop
+            stmt = select(*RECOMMENDATION_COLUMNS).where(
                 Document.company_id == company_id
-            ).order_by(Document.created_at.desc()).limit(limit).all()
+            ).order_by(Document.created_at.desc(), Document.id.desc()).limit(limit)
+            loop = asyncio.get_running_loop()
+            company_documents = await loop.run_in_executor(None, lambda: db.execute(stmt).all())
             
             recommendations = []
             for i, doc in enumerate(company_documents):
@@ -449,16 +710,11 @@ class RecommendationService:
                 # This ensures users with real query similarity always rank higher
                 baseline_score = max(0.15, 0.25 - (i * 0.02))
                 
-                recommendations.append({
-                    "id": doc.id,
-                    "title": doc.title,
-                    "content": doc.content[:300] + "..." if len(doc.content) > 300 else doc.content,
-                    "source": doc.source,
-                    "confidence": doc.confidence,
-                    "relevance_score": baseline_score,
-                    "explanation": f"New user suggestion: popular content in your organization.",
-                    "created_at": doc.created_at.isoformat()
-                })
+                recommendations.append(self._to_recommendation(
+                    doc,
+                    baseline_score,
+                    f"New user suggestion: popular content in your organization."
+                ))
             
             return recommendations
             
@@ -1,140 +1,491 @@
 """
 Simple, reliable recommendation service for real-time recommendations without datetime complications
 """
+import os
+import stat
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Dict
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.preprocessing import normalize
+from typing import List, Dict, Optional, Tuple
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from models.models import Document, Query
+from services.recommendation_service import _top_k_indices
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Fitted indexes are also written here, one file per company, so a restarted
+# worker picks them up instead of refitting on its first request. The directory
+# must belong to this user and not be writable by anyone else
+INDEX_CACHE_DIR = os.getenv(
+    "RECOMMENDATION_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "discover-recommendations")
+)
+
+# Refit a company's IDF weights once this many documents were appended since
+# the last fit, relative to the fitted corpus, so they track the corpus
+REFIT_GROWTH = 0.2
+
+# Weight of each older query relative to the next newer one when a user's
+# recent queries are combined
+QUERY_RECENCY_DECAY = 0.9
+
+# Recommendation explanations by tier, strongest similarity first; rows point
+# at these shared strings instead of building their own copies
+EXPLANATION_TIERS = (
+    "Highly relevant to your queries.",
+    "May be useful based on your query patterns.",
+    "Team knowledge - exploring different perspectives.",
+    "Related to your interests."
+)
+FALLBACK_EXPLANATION = "Popular content in your organization."
+
+# Simple fixed datetime reported for every recommendation
+FIXED_CREATED_AT = "2025-08-05T12:00:00"
+
+# Leading characters of a document's content that are scored; the 300
+# character snippet shown is cut from the same prefix
+INDEXED_CONTENT_CHARS = 4000
+
+# Document fields read when indexing; selecting them skips ORM hydration,
+# and content is truncated in SQL so long bodies never leave the database
+DOCUMENT_COLUMNS = (
+    Document.id,
+    Document.title,
+    func.substr(Document.content, 1, INDEXED_CONTENT_CHARS).label("content"),
+    Document.created_by_user_id
+)
+
+# Document fields shown with a recommendation, besides the snippet
+DISPLAY_COLUMNS = (Document.id, Document.title, Document.source, Document.confidence)
+
+def _query_similarities(doc_matrix: sparse.csc_matrix, query_vector: sparse.csr_matrix) -> np.ndarray:
+    """
+    Cosine similarity of every document to one query. Rows are L2-normalized
+    when weighted, so this is a dot product; only the postings of the
+    query's own terms are read, and documents sharing no term stay at zero.
+    """
+    return doc_matrix[:, query_vector.indices] @ query_vector.data
+
+def _snippet(content: str) -> str:
+    """First 300 characters of a document's content, shown with a recommendation"""
+    return content[:300] + "..." if len(content) > 300 else content
+
+def _document_ids(documents: List[Document]) -> np.ndarray:
+    """Ids of document rows, in order"""
+    return np.array([doc.id for doc in documents], dtype=np.int64)
+
+def _document_authors(documents: List[Document]) -> np.ndarray:
+    """Authors of document rows, in order; a missing author is NaN, which equals no user id"""
+    return np.array([doc.created_by_user_id for doc in documents], dtype=float)
+
+def _document_snippets(documents: List[Document]) -> Dict[int, str]:
+    """Snippets of document rows by id, cut while their text is loaded for indexing"""
+    return {doc.id: _snippet(doc.content) for doc in documents}
+
+def _index_dir_is_private() -> bool:
+    """Create the index directory if needed; True if only this user can write to it"""
+    os.makedirs(INDEX_CACHE_DIR, mode=0o700, exist_ok=True)
+    # lstat, so a symlink planted in place of the directory is refused too
+    info = os.lstat(INDEX_CACHE_DIR)
+    return (
+        stat.S_ISDIR(info.st_mode)
+        and info.st_uid == os.getuid()
+        and not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+    )
+
+def _combine_queries(query_vectors: sparse.csr_matrix) -> sparse.csr_matrix:
+    """
+    One query vector from the TF-IDF rows of a user's queries, newest first:
+    their recency-weighted sum, L2-normalized like the document rows.
+    """
+    weights = QUERY_RECENCY_DECAY ** np.arange(query_vectors.shape[0], dtype=np.float32)
+    # A 1 x n sparse product keeps the sum sparse; a dense weight vector
+    # would materialize all 2**18 columns
+    combined = sparse.csr_matrix(weights) @ query_vectors
+    combined.sum_duplicates()
+    return normalize(combined, copy=False)
+
 class SimpleRecommendationService:
     def __init__(self):
-        self.vectorizer = TfidfVectorizer(
-            max_features=1000,
+        # Terms are hashed to columns, so there is no vocabulary to build or keep
+        # per company; only the IDF weights are fitted
+        self.vectorizer = HashingVectorizer(
+            n_features=2 ** 18,
             stop_words='english',
-            ngram_range=(1, 2)
+            ngram_range=(1, 2),
+            alternate_sign=False,
+            norm=None,
+            # Half the bytes per weight; query products are memory-bound
+            dtype=np.float32
         )
+        # company_id -> (fitted IDF weights, column-major document matrix, document ids,
+        # document authors, snippets by document id, documents at last fit, corpus
+        # generation at last fit); rows follow the newest-first document order, so the
+        # first id is the max document id seen, and each column is a term's postings
+        self._cache: Dict[
+            int, Tuple[np.ndarray, sparse.csc_matrix, np.ndarray, np.ndarray, Dict[int, str], int, int]
+        ] = {}
     
     def get_recommendations(
         self, 
         user_id: int, 
         company_id: int, 
         db: Session,
-        limit: int = 20
+        limit: int = 20,
+        corpus_generation: int = 0
     ) -> List[Dict]:
         """
-        Get real-time recommendations without caching or datetime complications
+        Get real-time recommendations from the company's cached document index.
+        corpus_generation is the company's CacheService.get_corpus_generation
+        counter; a new value means documents were edited in place, so the index
+        is refitted.
         """
         try:
-            # Get user's recent queries
-            user_queries = db.query(Query).filter(
+            # Get user's recent queries; only the columns used are loaded, as plain rows
+            user_queries = db.query(Query.query_text, Query.user_id).filter(
                 Query.user_id == user_id,
                 Query.company_id == company_id
             ).order_by(Query.id.desc()).limit(10).all()
             
-            # Get all company documents
-            company_documents = db.query(Document).filter(
-                Document.company_id == company_id
-            ).order_by(Document.id.desc()).all()
-            
-            if not company_documents:
-                return []
-            
             if not user_queries:
                 # New user - return recent company documents
-                return self._get_fallback_recommendations(company_documents, limit)
+                return self._get_fallback_recommendations(company_id, db, limit)
             
             # Calculate TF-IDF similarity
-            return self._calculate_recommendations(user_queries, company_documents, limit)
+            return self._calculate_recommendations(user_queries, company_id, db, limit, corpus_generation)
             
         except Exception as e:
             logger.error(f"Error in recommendations: {str(e)}")
             return []
     
+    def get_recommendations_batch(
+        self, 
+        user_ids: List[int], 
+        company_id: int, 
+        db: Session,
+        limit: int = 20,
+        corpus_generation: int = 0
+    ) -> Dict[int, List[Dict]]:
+        """
+        Recommendations for several users of a company at once. Queries are
+        loaded in one round trip and every user's combined query is scored
+        against the same cached document matrix; corpus_generation is as for
+        get_recommendations.
+        """
+        recommendations: Dict[int, List[Dict]] = {user_id: [] for user_id in user_ids}
+        try:
+            # Each user's 10 most recent queries, newest first
+            recency = func.row_number().over(
+                partition_by=Query.user_id, order_by=Query.id.desc()
+            ).label("recency")
+            recent_queries = db.query(Query.user_id, Query.query_text, recency).filter(
+                Query.user_id.in_(user_ids),
+                Query.company_id == company_id
+            ).subquery()
+            query_rows = db.query(recent_queries.c.user_id, recent_queries.c.query_text).filter(
+                recent_queries.c.recency <= 10
+            ).order_by(recent_queries.c.user_id, recent_queries.c.recency).all()
+            
+            query_texts: Dict[int, List[str]] = {}
+            for user_id, query_text in query_rows:
+                query_texts.setdefault(user_id, []).append(query_text)
+            
+            # New users - recent company documents
+            if recommendations.keys() - query_texts.keys():
+                fallback = self._get_fallback_recommendations(company_id, db, limit)
+                for user_id in recommendations.keys() - query_texts.keys():
+                    recommendations[user_id] = fallback
+            
+            index = self._get_document_matrix(company_id, db, corpus_generation) if query_texts else None
+            if index is not None:
+                idf, doc_vectors, doc_ids, created_by, snippets = index
+                # Every user's queries in one transform; each user's rows are a contiguous slice
+                query_vectors = self._vectorize(idf, [text for texts in query_texts.values() for text in texts])
+                offsets = np.cumsum([0] + [len(texts) for texts in query_texts.values()])
+                # Each user reads only the postings of their own query terms
+                for row, user_id in enumerate(query_texts):
+                    query_vector = _combine_queries(query_vectors[offsets[row]:offsets[row + 1]])
+                    similarities = _query_similarities(doc_vectors, query_vector)
+                    recommendations[user_id] = self._to_recommendations(
+                        db, doc_ids, snippets, *self._rank_documents(similarities, created_by, user_id, limit)
+                    )
+            
+            return recommendations
+            
+        except Exception as e:
+            logger.error(f"Error in batch recommendations: {str(e)}")
+            return {user_id: [] for user_id in user_ids}
+    
     def _calculate_recommendations(
         self, 
         user_queries: List[Query], 
-        documents: List[Document], 
-        limit: int
+        company_id: int, 
+        db: Session, 
+        limit: int,
+        corpus_generation: int = 0
     ) -> List[Dict]:
         """Simple TF-IDF recommendation calculation"""
         try:
-            # Combine user queries
-            query_texts = [q.query_text for q in user_queries]
-            combined_query = " ".join(query_texts)
-            
-            # Prepare document texts
-            doc_texts = [f"{doc.title} {doc.content}" for doc in documents]
-            
-            # Calculate TF-IDF
-            all_texts = [combined_query] + doc_texts
-            tfidf_matrix = self.vectorizer.fit_transform(all_texts)
-            
-            # Calculate similarities
-            query_vector = tfidf_matrix[0:1]
-            doc_vectors = tfidf_matrix[1:]
-            similarities = cosine_similarity(query_vector, doc_vectors)[0]
+            # Calculate TF-IDF: the corpus is fitted once, only the queries are transformed
+            index = self._get_document_matrix(company_id, db, corpus_generation)
+            if index is None:
+                return []
+            idf, doc_vectors, doc_ids, created_by, snippets = index
             
-            # Create recommendations
-            recommendations = []
-            current_user_id = user_queries[0].user_id
+            # Combine user queries, favouring the most recent
+            query_vector = _combine_queries(self._vectorize(idf, [q.query_text for q in user_queries]))
             
-            for i, (doc, similarity) in enumerate(zip(documents, similarities)):
-                if similarity > 0.01:  # Low threshold for diversity
-                    
-                    # Cross-user boost
-                    score = similarity
-                    if doc.created_by_user_id != current_user_id:
-                        score += 0.05
-                        explanation = "Team knowledge - exploring different perspectives."
-                    else:
-                        explanation = "Related to your interests."
-                    
-                    # Higher similarity boost
-                    if similarity > 0.3:
-                        explanation = "Highly relevant to your queries."
-                    elif similarity > 0.15:
-                        explanation = "May be useful based on your query patterns."
-                    
-                    recommendations.append({
-                        "id": doc.id,
-                        "title": doc.title,
-                        "content": doc.content[:300] + "..." if len(doc.content) > 300 else doc.content,
-                        "source": doc.source,
-                        "confidence": doc.confidence,
-                        "relevance_score": float(score),
-                        "explanation": explanation,
-                        "created_at": "2025-08-05T12:00:00"  # Simple fixed datetime
-                    })
+            similarities = _query_similarities(doc_vectors, query_vector)
             
-            # Sort by score and return top results
-            recommendations.sort(key=lambda x: x["relevance_score"], reverse=True)
-            return recommendations[:limit]
+            return self._to_recommendations(
+                db, doc_ids, snippets, *self._rank_documents(similarities, created_by, user_queries[0].user_id, limit)
+            )
             
         except Exception as e:
             logger.error(f"Error calculating recommendations: {str(e)}")
             return []
     
-    def _get_fallback_recommendations(self, documents: List[Document], limit: int) -> List[Dict]:
+    def _rank_documents(
+        self, 
+        similarities: np.ndarray, 
+        created_by: np.ndarray, 
+        current_user_id: int, 
+        limit: int
+    ) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        """
+        Boost, explain and rank documents by their similarity to a user's
+        queries. Returns the top rows, their scores and their explanations.
+        """
+        # Cross-user boost; a missing author counts as another user
+        cross_user = created_by != current_user_id
+        scores = similarities + 0.05 * cross_user
+        
+        # Low threshold for diversity; only the top results are materialized
+        top = _top_k_indices(scores, np.flatnonzero(similarities > 0.01), limit)
+        
+        # Higher similarity tiers take precedence over the cross-user explanation
+        tiers = np.select(
+            [similarities[top] > 0.3, similarities[top] > 0.15, cross_user[top]],
+            [0, 1, 2],
+            default=3
+        )
+        
+        return top, scores[top], [EXPLANATION_TIERS[tier] for tier in tiers.tolist()]
+    
+    def _to_recommendations(
+        self, 
+        db: Session, 
+        doc_ids: np.ndarray, 
+        snippets: Dict[int, str], 
+        rows: np.ndarray, 
+        scores: np.ndarray, 
+        explanations: List[str]
+    ) -> List[Dict]:
+        """
+        Build the ranked documents' recommendations, in rank order. Snippets
+        come from the index, so only the small display fields are queried.
+        """
+        ranked_ids = doc_ids[rows].tolist()
+        documents = {
+            doc.id: doc for doc in db.query(*DISPLAY_COLUMNS).filter(Document.id.in_(ranked_ids))
+        }
+        
+        recommendations = []
+        for doc_id, score, explanation in zip(ranked_ids, scores.tolist(), explanations):
+            # Skip documents deleted since the index was checked
+            if doc_id in documents:
+                recommendations.append(
+                    self._to_recommendation(documents[doc_id], snippets[doc_id], score, explanation)
+                )
+        
+        return recommendations
+    
+    def _to_recommendation(self, doc: Document, snippet: str, score: float, explanation: str) -> Dict:
+        """Recommendation payload for a document row"""
+        return {
+            "id": doc.id,
+            "title": doc.title,
+            "content": snippet,
+            "source": doc.source,
+            "confidence": doc.confidence,
+            "relevance_score": score,
+            "explanation": explanation,
+            "created_at": FIXED_CREATED_AT
+        }
+    
+    def _get_document_matrix(
+        self, 
+        company_id: int, 
+        db: Session,
+        corpus_generation: int = 0
+    ) -> Optional[Tuple[np.ndarray, sparse.csc_matrix, np.ndarray, np.ndarray, Dict[int, str]]]:
+        """
+        Fitted IDF weights, column-major TF-IDF matrix, document ids, authors
+        and snippets for a company's documents (newest first), or None when it
+        has none. Document text is read only while a document is indexed. The
+        cached index, from this process or disk, is checked against the
+        company's document count, newest id and corpus generation: only
+        documents added since are loaded, transformed and stacked onto it,
+        and a delete, an in-place edit or enough growth refits.
+        """
+        max_doc_id, doc_count = db.query(func.max(Document.id), func.count(Document.id)).filter(
+            Document.company_id == company_id
+        ).one()
+        if not doc_count:
+            return None
+        
+        cached = self._cache.get(company_id) or self._load_index(company_id)
+        # Edited documents may be anywhere in the index, so only a refit catches them
+        if cached is not None and cached[6] == corpus_generation:
+            idf, doc_matrix, doc_ids, created_by, snippets, fitted_count, generation = cached
+            if doc_ids[0] == max_doc_id and len(doc_ids) == doc_count:
+                self._cache[company_id] = cached
+                return cached[:5]
+            
+            if doc_count <= fitted_count * (1 + REFIT_GROWTH):
+                new_documents = self._load_documents(db, company_id, Document.id > int(doc_ids[0]))
+                # Ids only grow, so unless a cached document was deleted the counts add up
+                if new_documents and len(doc_ids) + len(new_documents) == doc_count:
+                    new_matrix = self._vectorize(idf, [f"{doc.title} {doc.content}" for doc in new_documents])
+                    cached = (
+                        idf,
+                        sparse.vstack([new_matrix, doc_matrix], format="csc"),
+                        np.concatenate([_document_ids(new_documents), doc_ids]),
+                        np.concatenate([_document_authors(new_documents), created_by]),
+                        {**snippets, **_document_snippets(new_documents)},
+                        fitted_count,
+                        generation
+                    )
+                    self._store_index(company_id, cached)
+                    return cached[:5]
+        
+        documents = self._load_documents(db, company_id)
+        if not documents:
+            return None
+        
+        term_counts = self.vectorizer.transform([f"{doc.title} {doc.content}" for doc in documents])
+        idf = TfidfTransformer().fit(term_counts).idf_.astype(np.float32)
+        
+        # Terms seen in a single document carry no weight, unless that would drop
+        # every term (a lone document shares no terms with another one to keep)
+        document_frequency = np.bincount(term_counts.indices, minlength=term_counts.shape[1])
+        rare = document_frequency == 1
+        if np.count_nonzero(rare) < np.count_nonzero(document_frequency):
+            idf[rare] = 0.0
+        
+        # Requests read the matrix by query-term columns
+        cached = (
+            idf,
+            self._weigh(idf, term_counts).tocsc(),
+            _document_ids(documents),
+            _document_authors(documents),
+            _document_snippets(documents),
+            len(documents),
+            corpus_generation
+        )
+        self._store_index(company_id, cached)
+        return cached[:5]
+    
+    def _vectorize(self, idf: np.ndarray, texts: List[str]) -> sparse.csr_matrix:
+        """TF-IDF rows for texts, weighted by a company's fitted IDF"""
+        return self._weigh(idf, self.vectorizer.transform(texts))
+    
+    def _weigh(self, idf: np.ndarray, term_counts: sparse.csr_matrix) -> sparse.csr_matrix:
+        """
+        Weigh hashed term counts in place: log-scaled counts so repeated terms
+        don't swamp short queries, times IDF, L2-normalized rows. Indexing the
+        IDF by column avoids building a 2**18 diagonal matrix per call.
+        """
+        np.log(term_counts.data, out=term_counts.data)
+        term_counts.data += 1
+        term_counts.data *= idf[term_counts.indices]
+        # Weightless terms leave explicit zeros behind
+        term_counts.eliminate_zeros()
+        return normalize(term_counts, copy=False)
+    
+    def _load_documents(self, db: Session, company_id: int, *criteria) -> List[Document]:
+        """A company's document rows matching criteria, newest first"""
+        return db.query(*DOCUMENT_COLUMNS).filter(
+            Document.company_id == company_id, *criteria
+        ).order_by(Document.id.desc()).all()
+    
+    def _index_path(self, company_id: int) -> str:
+        """File holding a company's persisted index"""
+        return os.path.join(INDEX_CACHE_DIR, f"company_{company_id}.npz")
+    
+    def _store_index(self, company_id: int, index: Tuple) -> None:
+        """
+        Keep a company's index in memory and persist it for the next worker
+        start. Only plain arrays are written, so loading never unpickles.
+        """
+        self._cache[company_id] = index
+        idf, doc_matrix, doc_ids, created_by, snippets, fitted_count, generation = index
+        try:
+            if not _index_dir_is_private():
+                logger.warning(f"Not persisting recommendation index: {INDEX_CACHE_DIR} is not private")
+                return
+            # Write then rename, so concurrent workers never read a partial file
+            path = self._index_path(company_id)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as index_file:
+                np.savez_compressed(
+                    index_file,
+                    idf=idf,
+                    data=doc_matrix.data,
+                    indices=doc_matrix.indices,
+                    indptr=doc_matrix.indptr,
+                    shape=np.array(doc_matrix.shape),
+                    doc_ids=doc_ids,
+                    created_by=created_by,
+                    # Snippets in row order, as a plain string array
+                    snippets=np.array([snippets[doc_id] for doc_id in doc_ids.tolist()]),
+                    fitted_count=np.array(fitted_count),
+                    generation=np.array(generation)
+                )
+            os.replace(temp_path, path)
+        except Exception as e:
+            logger.warning(f"Error persisting recommendation index: {str(e)}")
+    
+    def _load_index(self, company_id: int) -> Optional[Tuple]:
+        """A company's index persisted by an earlier run, if any"""
+        path = self._index_path(company_id)
+        try:
+            if not os.path.exists(path) or not _index_dir_is_private():
+                return None
+            with np.load(path, allow_pickle=False) as arrays:
+                doc_ids = arrays["doc_ids"]
+                return (
+                    arrays["idf"],
+                    sparse.csc_matrix(
+                        (arrays["data"], arrays["indices"], arrays["indptr"]),
+                        shape=tuple(arrays["shape"])
+                    ),
+                    doc_ids,
+                    arrays["created_by"],
+                    dict(zip(doc_ids.tolist(), arrays["snippets"].tolist())),
+                    int(arrays["fitted_count"]),
+                    int(arrays["generation"])
+                )
+        except Exception as e:
+            logger.warning(f"Error loading recommendation index: {str(e)}")
+            return None
+    
+    def _get_fallback_recommendations(self, company_id: int, db: Session, limit: int) -> List[Dict]:
         """Simple fallback for new users"""
         recommendations = []
         
-        for i, doc in enumerate(documents[:limit]):
+        # Most recent company documents, with just enough content for a snippet
+        documents = db.query(*DISPLAY_COLUMNS, func.substr(Document.content, 1, 301).label("content")).filter(
+            Document.company_id == company_id
+        ).order_by(Document.id.desc()).limit(limit).all()
+        
+        for i, doc in enumerate(documents):
             score = max(0.15, 0.25 - (i * 0.02))
             
-            recommendations.append({
-                "id": doc.id,
-                "title": doc.title,
-                "content": doc.content[:300] + "..." if len(doc.content) > 300 else doc.content,
-                "source": doc.source,
-                "confidence": doc.confidence,
-                "relevance_score": score,
-                "explanation": "Popular content in your organization.",
-                "created_at": "2025-08-05T12:00:00"
-            })
+            recommendations.append(
+                self._to_recommendation(doc, _snippet(doc.content), score, FALLBACK_EXPLANATION)
+            )
         
-        return recommendations
\ No newline at end of file
+        return recommendations
@@ -0,0 +1,76 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from models import Base, get_db
+from routers import documents_router
+
+
+@pytest.fixture
+def client():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    SessionLocal = sessionmaker(bind=engine)
+    
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO companies (id, name, created_at) VALUES (1, 'Acme', '2025-08-01 09:00:00')"))
+        conn.execute(text(
+            "INSERT INTO users (id, name, email, company_id, created_at) "
+            "VALUES (1, 'Ann', 'ann@acme.com', 1, '2025-08-01 09:00:00')"
+        ))
+        # Stored like CURRENT_TIMESTAMP and the seed scripts: no fractional
+        # seconds, with several documents sharing a timestamp
+        for document_id in range(1, 8):
+            conn.execute(
+                text(
+                    "INSERT INTO documents (id, title, content, source, created_by_user_id, company_id, created_at) "
+                    "VALUES (:id, :title, 'body', 'Guide', 1, 1, :created_at)"
+                ),
+                {
+                    "id": document_id,
+                    "title": f"Doc {document_id}",
+                    "created_at": f"2025-08-0{1 + document_id // 3} 10:30:00"
+                }
+            )
+    
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+    
+    app = FastAPI()
+    app.include_router(documents_router, prefix="/api")
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+
+def test_keyset_pages_do_not_overlap(client):
+    first = client.get("/api/documents/", params={"company_id": 1, "limit": 3})
+    assert first.status_code == 200
+    
+    second = client.get("/api/documents/", params={
+        "company_id": 1,
+        "limit": 3,
+        "after_created_at": first.headers["X-Next-After-Created-At"],
+        "after_id": first.headers["X-Next-After-Id"]
+    })
+    assert second.status_code == 200
+    
+    first_ids = [document["id"] for document in first.json()]
+    second_ids = [document["id"] for document in second.json()]
+    assert first_ids == [7, 6, 5]
+    assert second_ids == [4, 3, 2]
@@ -0,0 +1,124 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import services.simple_recommendation_service as simple_recommendation_service
+from models import Base, get_db
+from routers import recommendations_router
+from services import SimpleRecommendationService
+from utils import get_cache_service
+
+DOCUMENTS = (
+    (1, "Kubernetes deployment guide", "Deploy a kubernetes cluster with helm charts", 1),
+    (2, "Payroll policy", "Monthly payroll runs on the last working day", 2),
+    (3, "Kubernetes cluster upgrades", "Upgrade kubernetes cluster nodes one at a time", 2),
+    (4, "Quarterly budget", "Capex budget forecast for the next quarter", 1),
+)
+
+
+class FakeCacheService:
+    """Corpus generation counter, bumped by the test in place of a document edit"""
+    def __init__(self):
+        self.generation = 0
+    
+    async def get_corpus_generation(self, company_id: int) -> int:
+        return self.generation
+
+
+@pytest.fixture
+def cache_service():
+    return FakeCacheService()
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture
+def client(engine, cache_service, tmp_path, monkeypatch):
+    monkeypatch.setattr(simple_recommendation_service, "INDEX_CACHE_DIR", str(tmp_path))
+    SessionLocal = sessionmaker(bind=engine)
+    
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO companies (id, name, created_at) VALUES (1, 'Acme', '2025-08-01 09:00:00')"))
+        conn.execute(text("INSERT INTO companies (id, name, created_at) VALUES (2, 'Other', '2025-08-01 09:00:00')"))
+        for user_id, company_id in ((1, 1), (2, 1), (3, 2)):
+            conn.execute(
+                text(
+                    "INSERT INTO users (id, name, email, company_id, created_at) "
+                    "VALUES (:id, :name, :email, :company_id, '2025-08-01 09:00:00')"
+                ),
+                {"id": user_id, "name": f"User {user_id}", "email": f"user{user_id}@acme.com", "company_id": company_id}
+            )
+        for document_id, title, content, author in DOCUMENTS:
+            conn.execute(
+                text(
+                    "INSERT INTO documents (id, title, content, source, confidence, created_by_user_id, company_id, created_at) "
+                    "VALUES (:id, :title, :content, 'Guide', 0.8, :author, 1, '2025-08-02 10:30:00')"
+                ),
+                {"id": document_id, "title": title, "content": content, "author": author}
+            )
+        conn.execute(text(
+            "INSERT INTO queries (query_text, user_id, company_id, created_at) "
+            "VALUES ('how to upgrade a kubernetes cluster', 1, 1, '2025-08-03 10:30:00')"
+        ))
+    
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+    
+    app = FastAPI()
+    app.include_router(recommendations_router, prefix="/api")
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_cache_service] = lambda: cache_service
+    app.state.simple_recommendation_service = SimpleRecommendationService()
+    return TestClient(app)
+
+
+def test_batch_recommendations(client):
+    response = client.post("/api/recommendations/batch", json={"user_ids": [1, 2], "company_id": 1, "limit": 3})
+    assert response.status_code == 200
+    
+    recommendations = response.json()
+    assert set(recommendations) == {"1", "2"}
+    # User 1 searched for kubernetes upgrades
+    assert recommendations["1"][0]["id"] == 3
+    assert {document["id"] for document in recommendations["1"]} <= {1, 3}
+    # User 2 has no queries yet and gets the newest company documents
+    assert [document["id"] for document in recommendations["2"]] == [4, 3, 2]
+
+
+def test_batch_recommendations_rejects_other_company_users(client):
+    response = client.post("/api/recommendations/batch", json={"user_ids": [1, 3], "company_id": 1})
+    assert response.status_code == 400
+
+
+def test_batch_recommendations_refit_after_document_edit(client, engine, cache_service):
+    first = client.post("/api/recommendations/batch", json={"user_ids": [1], "company_id": 1}).json()
+    assert first["1"][0]["id"] == 3
+    
+    # An in-place edit keeps the document count and newest id
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE documents SET title = 'Office plants', content = 'Water them weekly' WHERE id = 3"))
+    cache_service.generation += 1
+    
+    edited = client.post("/api/recommendations/batch", json={"user_ids": [1], "company_id": 1}).json()
+    assert [document["id"] for document in edited["1"]] == [1]
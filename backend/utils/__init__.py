@@ -1 +1,11 @@
-# Utility functions and helpers
\ No newline at end of file
+# Utility functions and helpers
+from .validation import user_in_company, user_in_company_cached
+from .dependencies import get_cache_service, get_recommendation_service, get_simple_recommendation_service
+
+__all__ = [
+    "user_in_company",
+    "user_in_company_cached",
+    "get_cache_service",
+    "get_recommendation_service",
+    "get_simple_recommendation_service"
+]
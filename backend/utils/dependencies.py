@@ -0,0 +1,21 @@
+"""
+FastAPI dependencies for the shared services created in the app lifespan
+"""
+from fastapi import Request
+
+from services import CacheService, RecommendationService, SimpleRecommendationService
+
+
+def get_cache_service(request: Request) -> CacheService:
+    """The app-wide CacheService (one Redis connection pool per process)"""
+    return request.app.state.cache_service
+
+
+def get_recommendation_service(request: Request) -> RecommendationService:
+    """The app-wide RecommendationService"""
+    return request.app.state.recommendation_service
+
+
+def get_simple_recommendation_service(request: Request) -> SimpleRecommendationService:
+    """The app-wide SimpleRecommendationService, whose document indexes are kept per process"""
+    return request.app.state.simple_recommendation_service
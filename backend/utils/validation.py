@@ -0,0 +1,35 @@
+"""
+Shared request validation helpers
+"""
+from sqlalchemy import exists, lambda_stmt, select
+from sqlalchemy.orm import Session
+
+from models import User
+from services import CacheService
+
+
+def user_in_company(db: Session, user_id: int, company_id: int) -> bool:
+    """Check user/company membership without hydrating a User row"""
+    return db.execute(
+        lambda_stmt(lambda: select(exists().where(User.id == user_id, User.company_id == company_id)))
+    ).scalar()
+
+
+async def user_in_company_cached(
+    db: Session,
+    cache_service: CacheService,
+    user_id: int,
+    company_id: int
+) -> bool:
+    """
+    Membership check that consults Redis first. Only positive results are
+    cached, so an invalid pair always falls through to the database.
+    """
+    if await cache_service.is_user_in_company(user_id, company_id):
+        return True
+    
+    if not user_in_company(db, user_id, company_id):
+        return False
+    
+    await cache_service.cache_user_membership(user_id, company_id)
+    return True
@@ -17,7 +17,7 @@ import {
   SearchResponse,
   Recommendation,
   Query,
-  Document as AppDocument,
+  DocumentSummary,
 } from '../types';
 
 // Companies
@@ -163,7 +163,7 @@ export const useHealthCheck = () => {
 // Custom hook for loading state management
 // Documents
 export const useDocuments = (company_id?: number, user_id?: number) => {
-  return useQuery<AppDocument[]>(
+  return useQuery<DocumentSummary[]>(
     ['documents', company_id, user_id],
     async () => {
       if (!company_id) return [];
@@ -5,6 +5,7 @@ import {
   User,
   UserCreate,
   Document,
+  DocumentSummary,
   Query,
   SearchRequest,
   SearchResponse,
@@ -138,7 +139,7 @@ export const documentApi = {
     user_id?: number,
     skip = 0,
     limit = 50
-  ): Promise<AxiosResponse<Document[]>> =>
+  ): Promise<AxiosResponse<DocumentSummary[]>> =>
     api.get('/documents', {
       params: { company_id, user_id, skip, limit },
     }),
@@ -156,7 +157,7 @@ export const documentApi = {
     company_id: number,
     skip = 0,
     limit = 50
-  ): Promise<AxiosResponse<Document[]>> =>
+  ): Promise<AxiosResponse<DocumentSummary[]>> =>
     api.get(`/documents/user/${user_id}`, {
       params: { company_id, skip, limit },
     }),
@@ -38,6 +38,9 @@ export interface Document {
   created_by_user: User;
 }
 
+// Document metadata returned by list endpoints (no content body)
+export type DocumentSummary = Omit<Document, 'content'>;
+
 export interface DocumentCreate {
   title: string;
   content: string;
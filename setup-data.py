@@ -3,6 +3,9 @@
 Setup script to populate the database with sample data for testing
 """
 
+import asyncio
+import httpx
+import os
 import requests
 import json
 import sys
@@ -10,6 +13,12 @@ import time
 
 # Configuration
 API_BASE_URL = "http://localhost:8000/api"
+# One keep-alive connection reused by every synchronous API call
+SESSION = requests.Session()
+
+# Sample searches in flight at once; each one calls the LLM API, so keep this
+# within your API rate limit
+QUERY_CONCURRENCY = int(os.getenv("SETUP_QUERY_CONCURRENCY", "5"))
 SAMPLE_COMPANIES = [
     {"name": "TechCorp Solutions"},
     {"name": "InnovateAI Labs"},
@@ -43,7 +52,7 @@ def wait_for_api():
     max_retries = 30
     for i in range(max_retries):
         try:
-            response = requests.get(f"{API_BASE_URL[:-4]}/health")
+            response = SESSION.get(f"{API_BASE_URL[:-4]}/health")
             if response.status_code == 200:
                 print("✅ API is ready!")
                 return True
@@ -61,17 +70,17 @@ def create_companies():
     print("📊 Creating sample companies...")
     companies = []
     
-    for company_data in SAMPLE_COMPANIES:
-        try:
-            response = requests.post(f"{API_BASE_URL}/companies", json=company_data)
-            if response.status_code == 201:
-                company = response.json()
-                companies.append(company)
+    # All companies in a single request
+    try:
+        response = SESSION.post(f"{API_BASE_URL}/companies/bulk", json=SAMPLE_COMPANIES)
+        if response.status_code == 201:
+            companies = response.json()
+            for company in companies:
                 print(f"   ✅ Created company: {company['name']}")
-            else:
-                print(f"   ❌ Failed to create company {company_data['name']}: {response.text}")
-        except Exception as e:
-            print(f"   ❌ Error creating company {company_data['name']}: {str(e)}")
+        else:
+            print(f"   ❌ Failed to create companies: {response.text}")
+    except Exception as e:
+        print(f"   ❌ Error creating companies: {str(e)}")
     
     return companies
 
@@ -83,6 +92,7 @@ def create_users(companies):
     # Distribute users across companies
     users_per_company = len(SAMPLE_USERS) // len(companies)
     
+    users_data = []
     for i, company in enumerate(companies):
         start_idx = i * users_per_company
         end_idx = start_idx + users_per_company
@@ -92,30 +102,55 @@ def create_users(companies):
         company_users = SAMPLE_USERS[start_idx:end_idx]
         
         for user_data in company_users:
-            user_data_with_company = {
+            users_data.append({
                 **user_data,
                 "company_id": company["id"]
-            }
-            
-            try:
-                response = requests.post(f"{API_BASE_URL}/users", json=user_data_with_company)
-                if response.status_code == 201:
-                    user = response.json()
-                    users.append(user)
-                    print(f"   ✅ Created user: {user['name']} at {company['name']}")
-                else:
-                    print(f"   ❌ Failed to create user {user_data['name']}: {response.text}")
-            except Exception as e:
-                print(f"   ❌ Error creating user {user_data['name']}: {str(e)}")
+            })
+    
+    # All users in a single request
+    try:
+        response = SESSION.post(f"{API_BASE_URL}/users/bulk", json=users_data)
+        if response.status_code == 201:
+            users = response.json()
+            for user in users:
+                print(f"   ✅ Created user: {user['name']} at {user['company']['name']}")
+        else:
+            print(f"   ❌ Failed to create users: {response.text}")
+    except Exception as e:
+        print(f"   ❌ Error creating users: {str(e)}")
     
     return users
 
+async def post_search(client, search_data, user, semaphore):
+    """Run one sample search once a concurrency slot is free"""
+    query = search_data["query"]
+    async with semaphore:
+        try:
+            response = await client.post(f"{API_BASE_URL}/search/", json=search_data)
+            if response.status_code == 200:
+                print(f"   ✅ Created query for {user['name']}: {query[:50]}...")
+            else:
+                print(f"   ❌ Failed to create query: {response.text}")
+        except Exception as e:
+            print(f"   ❌ Error creating query: {str(e)}")
+
+async def run_sample_queries(searches):
+    """Post all sample searches, QUERY_CONCURRENCY at a time"""
+    semaphore = asyncio.Semaphore(QUERY_CONCURRENCY)
+    # Searches wait on the LLM, so allow far longer than httpx's 5s default
+    async with httpx.AsyncClient(timeout=120.0) as client:
+        await asyncio.gather(*(
+            post_search(client, search_data, user, semaphore)
+            for search_data, user in searches
+        ))
+
 def create_sample_queries(users):
     """Create sample queries and documents for users"""
     print("🔍 Creating sample queries and documents...")
     
     import random
     
+    searches = []
     for user in users:
         # Create 2-4 queries per user
         num_queries = random.randint(2, 4)
@@ -128,20 +163,11 @@ def create_sample_queries(users):
                 "company_id": user["company_id"],
                 "save_as_document": True
             }
-            
-            try:
-                response = requests.post(f"{API_BASE_URL}/search", json=search_data)
-                if response.status_code == 200:
-                    result = response.json()
-                    print(f"   ✅ Created query for {user['name']}: {query[:50]}...")
-                else:
-                    print(f"   ❌ Failed to create query: {response.text}")
-                    
-                # Add small delay to avoid overwhelming the LLM API
-                time.sleep(1)
-                
-            except Exception as e:
-                print(f"   ❌ Error creating query: {str(e)}")
+            searches.append((search_data, user))
+    
+    # Requests overlap instead of running one after another with a fixed delay;
+    # the semaphore bounds the load on the LLM API
+    asyncio.run(run_sample_queries(searches))
 
 def main():
     """Main setup function"""